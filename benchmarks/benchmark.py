@@ -0,0 +1,211 @@
+"""
+benchmarks the exporters against the local mock Datadog API.
+
+Each scenario runs in a separate process, so that the peak RSS is measured
+per scenario. The CPU time of each stage of the export is taken from the
+statistics of the exporter, see `datadog_export.stats.Stats`.
+
+usage: python benchmarks/benchmark.py --days 7 --window 1h --series 20
+"""
+
+import json
+import resource
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from time import perf_counter, process_time
+from typing import List, Optional
+
+import click
+import pytz
+from durations import Duration
+
+from datadog_export import click_argument_types
+from datadog_export.columnar import ColumnarWriter
+from datadog_export.events import EventsExporter
+from datadog_export.metrics import MetricsExporter
+from datadog_export.mock_api import MockAPI
+from datadog_export.names import MetricNamesExporter
+
+scenarios = {
+    "metrics-json": ("metrics", {"format": "json"}),
+    "metrics-json-iso": ("metrics", {"format": "json", "iso_date_formats": True}),
+    "metrics-ndjson": ("metrics", {"format": "ndjson"}),
+    "metrics-ndjson-streaming": ("metrics", {"format": "ndjson", "streaming": True}),
+    "metrics-parquet": ("metrics", {"format": "parquet"}),
+    "metrics-arrow": ("metrics", {"format": "arrow"}),
+    "events-json": ("events", {"format": "json"}),
+    "events-ndjson": ("events", {"format": "ndjson"}),
+    "names": ("names", {}),
+}
+
+exporters = {
+    "metrics": MetricsExporter,
+    "events": EventsExporter,
+    "names": MetricNamesExporter,
+}
+
+
+def run(
+    name: str, url: str, start_time: datetime, end_time: datetime, window, options: dict
+) -> dict:
+    kind, attributes = scenarios[name]
+    if kind == "names":
+        exporter = MetricNamesExporter("DEFAULT", start_time)
+    else:
+        exporter = exporters[kind]("DEFAULT", start_time, end_time, window)
+    exporter.api_host = url
+    exporter.headers = {}
+    for attribute, value in attributes.items():
+        setattr(exporter, attribute, value)
+    if kind == "metrics":
+        exporter.queries = [
+            f"avg:benchmark.metric.{i}{{*}} by {{host}}"
+            for i in range(options["queries"])
+        ]
+    if kind != "names":
+        exporter.concurrency = options["concurrency"]
+
+    exporter.open_output("/dev/null")
+    if exporter.format in ColumnarWriter.formats:
+        exporter.columnar_writer = ColumnarWriter(
+            exporter.output.buffer, exporter.format
+        )
+
+    started, cpu = perf_counter(), process_time()
+    try:
+        exporter.export()
+    finally:
+        exporter.close()
+    elapsed = perf_counter() - started
+
+    stats = exporter.stats.to_dict()
+    counters = stats["counters"]
+    result = {
+        "scenario": name,
+        "elapsed": elapsed,
+        "cpu": process_time() - cpu,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "windows_per_sec": counters["windows"] / elapsed,
+        "points_per_sec": counters["points"] / elapsed,
+        "events_per_sec": counters["events"] / elapsed,
+    }
+    result.update(counters)
+    for stage, values in stats["stages"].items():
+        result[f"{stage}_seconds"] = values["seconds"]
+        result[f"{stage}_cpu"] = values["cpu"]
+    return result
+
+
+def report(results: List[dict]):
+    columns = [
+        ("elapsed", 2),
+        ("cpu", 2),
+        ("peak_rss_mb", 1),
+        ("windows_per_sec", 1),
+        ("points_per_sec", 0),
+        ("events_per_sec", 0),
+        ("wait_seconds", 2),
+        ("download_cpu", 2),
+        ("parse_cpu", 2),
+        ("convert_cpu", 2),
+        ("write_cpu", 2),
+    ]
+    print(f"{'scenario':<26}" + "".join(f"{name:>16}" for name, _ in columns))
+    for result in results:
+        print(
+            f"{result['scenario']:<26}"
+            + "".join(
+                f"{result.get(name, 0):>16.{precision}f}" for name, precision in columns
+            )
+        )
+
+
+@click.command()
+@click.option("--days", default=7, type=int, help="of data to export, default 7")
+@click.option(
+    "--window",
+    default=Duration("1h"),
+    type=click_argument_types.Duration(),
+    help="default 1h",
+)
+@click.option("--queries", default=1, type=int, help="per metrics export, default 1")
+@click.option("--series", default=10, type=int, help="per query, default 10")
+@click.option(
+    "--interval", default=20, type=int, help="between points in seconds, default 20"
+)
+@click.option("--events-per-hour", default=60, type=int, help="default 60")
+@click.option(
+    "--latency", default=0.0, type=float, help="of each API call in seconds, default 0"
+)
+@click.option(
+    "--rate-limit",
+    default=0,
+    type=int,
+    help="of the mock API per 10s, default unlimited",
+)
+@click.option(
+    "--throttle-rate",
+    default=0.0,
+    type=float,
+    help="fraction of calls answered with 429",
+)
+@click.option("--concurrency", default=1, type=int, help="of the exporter, default 1")
+@click.option(
+    "--scenario",
+    "selected",
+    multiple=True,
+    type=click.Choice(list(scenarios)),
+    help="to run, default all",
+)
+@click.option(
+    "--json-output",
+    type=click.Path(dir_okay=False),
+    help="file to write the results to",
+)
+def main(
+    days: int,
+    window: Duration,
+    queries: int,
+    series: int,
+    interval: int,
+    events_per_hour: int,
+    latency: float,
+    rate_limit: int,
+    throttle_rate: float,
+    concurrency: int,
+    selected: List[str],
+    json_output: Optional[str],
+):
+    """
+    benchmark the exporters against the mock Datadog API.
+    """
+    end_time = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+    start_time = end_time - timedelta(days=days)
+    options = {"queries": queries, "concurrency": concurrency}
+    results = []
+    with MockAPI(
+        series=series,
+        interval=interval,
+        events_per_hour=events_per_hour,
+        latency=latency,
+        rate_limit=rate_limit,
+        throttle_rate=throttle_rate,
+        seed=0,
+    ) as api:
+        for name in selected if selected else scenarios:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                future = pool.submit(
+                    run, name, api.url, start_time, end_time, window, options
+                )
+                results.append(future.result())
+            print(f"{name} completed in {results[-1]['elapsed']:.2f}s", file=sys.stderr)
+
+    report(results)
+    if json_output:
+        with open(json_output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
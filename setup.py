@@ -26,8 +26,9 @@ setup(
     zip_safe=False,
     platforms='any',
     install_requires=dependencies,
+    extras_require={'columnar': ['pyarrow'], 'yaml': ['PyYAML'], 'zstd': ['zstandard'], 'streaming': ['ijson'], 'numpy': ['numpy'], 'pandas': ['numpy', 'pandas']},
     setup_requires=[],
-    tests_require=dependencies +  ['pytest', 'botostubs', 'pytest-runner', 'mypy', 'yapf', 'twine', 'pycodestyle' ],
+    tests_require=dependencies +  ['pytest', 'moto', 'botostubs', 'pytest-runner', 'mypy', 'yapf', 'twine', 'pycodestyle' ],
     test_suite='tests',
     entry_points={
         'console_scripts': [
@@ -0,0 +1,100 @@
+from datetime import datetime
+from re import compile
+from typing import Iterator, List, Optional, Union
+
+import pytz
+import requests
+from durations import Duration
+
+from datadog_export.events import EventsExporter
+from datadog_export.exporter import Exporter
+from datadog_export.metrics import MetricsExporter
+from datadog_export.names import MetricNamesExporter
+from datadog_export.series import Series
+
+
+def configure(
+    exporter: Exporter, session: Optional[requests.Session], attributes: dict
+) -> Exporter:
+    """
+    sets the `attributes` of the `exporter`, and connects it to Datadog
+    through the `session`. An injected session which already carries the
+    DD-API-KEY header is used without reading the account configuration.
+    """
+    for name, value in attributes.items():
+        if not hasattr(exporter, name):
+            raise TypeError(f"{type(exporter).__name__} has no attribute {name}")
+        setattr(exporter, name, value)
+
+    if session is not None:
+        exporter.session = session
+        if "DD-API-KEY" in session.headers:
+            exporter.headers = {}
+            return exporter
+    exporter.connect()
+    return exporter
+
+
+def now() -> datetime:
+    return datetime.now().astimezone(pytz.UTC).replace(second=0, microsecond=0)
+
+
+def iter_series(
+    queries: Union[str, List[str]],
+    start_time: datetime,
+    end_time: Optional[datetime] = None,
+    window: Duration = Duration("24h"),
+    account: str = "DEFAULT",
+    session: Optional[requests.Session] = None,
+    **attributes,
+) -> Iterator[Series]:
+    """
+    yields the series of the metrics `queries` from `start_time` to
+    `end_time`, window by window. The other `attributes` of the
+    MetricsExporter, like concurrency or streaming, may be passed as keywords.
+
+    raises an ExportError when the export fails.
+    """
+    exporter = MetricsExporter(account, start_time, end_time or now(), window)
+    exporter.queries = [queries] if isinstance(queries, str) else list(queries)
+    yield from configure(exporter, session, attributes).series()
+
+
+def iter_events(
+    start_time: datetime,
+    end_time: Optional[datetime] = None,
+    window: Duration = Duration("24h"),
+    account: str = "DEFAULT",
+    session: Optional[requests.Session] = None,
+    **attributes,
+) -> Iterator[dict]:
+    """
+    yields the events from `start_time` to `end_time`, window by window.
+    The other `attributes` of the EventsExporter, like sources, tags or
+    pattern, may be passed as keywords.
+
+    raises an ExportError when the export fails.
+    """
+    exporter = EventsExporter(account, start_time, end_time or now(), window)
+    if isinstance(attributes.get("pattern"), str):
+        attributes["pattern"] = compile(attributes["pattern"])
+    yield from configure(exporter, session, attributes).events()
+
+
+def iter_metric_names(
+    start_time: datetime = datetime(1970, 1, 1, tzinfo=pytz.UTC),
+    pattern: Optional[str] = None,
+    hosts: Optional[List[str]] = None,
+    account: str = "DEFAULT",
+    session: Optional[requests.Session] = None,
+) -> Iterator[str]:
+    """
+    yields the names of the metrics created after `start_time`, which fully
+    match the regular expression `pattern`.
+
+    raises an ExportError when the export fails.
+    """
+    exporter = MetricNamesExporter(account, start_time)
+    exporter.pattern = compile(pattern) if pattern else None
+    exporter.hosts = hosts if hosts else []
+    yield from configure(exporter, session, {}).names()
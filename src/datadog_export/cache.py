@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from os import path
+from typing import BinaryIO, Dict, Optional
+
+import requests
+
+from datadog_export.logger import log
+
+
+class ResponseCache(object):
+    """
+    an on-disk cache of successful API responses, keyed by account, url and
+    query parameters. When the total size of the cached responses exceeds
+    `max_size` bytes, the least recently used responses are evicted until it
+    is below the `low_water` mark, a fraction of `max_size`.
+
+    The responses are tracked in an in-memory index in order of use, which
+    is read from the directory once.
+    """
+
+    low_water = 0.9
+
+    def __init__(self, directory: str, max_size: int):
+        self.directory = path.expanduser(directory)
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.entries: Dict[str, int] = OrderedDict()
+        os.makedirs(self.directory, exist_ok=True)
+        entries = [
+            e
+            for e in os.scandir(self.directory)
+            if e.is_file() and e.name.endswith(".json")
+        ]
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            self.entries[entry.path] = entry.stat().st_size
+            self.size += entry.stat().st_size
+
+    def filename(self, account: str, url: str, params: dict) -> str:
+        key = json.dumps([account, url, params], sort_keys=True, default=str)
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return path.join(self.directory, f"{digest}.json")
+
+    def get(
+        self, account: str, url: str, params: dict, stream: bool = False
+    ) -> Optional[requests.Response]:
+        """
+        returns the cached response, or None. If `stream` is set, the body is
+        not read, but returned as the open cache file in `response.raw`.
+        """
+        filename = self.filename(account, url, params)
+        try:
+            file = open(filename, "rb")
+            os.utime(filename)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+            if filename in self.entries:
+                self.entries.move_to_end(filename)
+        return self.response(url, file, stream)
+
+    def put(
+        self,
+        account: str,
+        url: str,
+        params: dict,
+        response: requests.Response,
+        stream: bool = False,
+    ) -> requests.Response:
+        """
+        stores the `response` in the cache, and returns it. A `stream`ed
+        response is copied to the cache file in chunks, and returned reading
+        from that file, so that its body is never held in memory. The file is
+        opened before it is added, so that it remains readable when evicted.
+        """
+        filename = self.filename(account, url, params)
+        tmp = f"{filename}.{threading.get_ident()}.tmp"
+        size = 0
+        with open(tmp, "wb") as file:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                file.write(chunk)
+                size += len(chunk)
+        body = open(tmp, "rb") if stream else None
+        os.replace(tmp, filename)
+        with self.lock:
+            self.size += size - self.entries.pop(filename, 0)
+            self.entries[filename] = size
+            if self.size > self.max_size:
+                self.evict()
+        if stream:
+            return self.response(url, body, stream)
+        return response
+
+    @staticmethod
+    def response(url: str, file: BinaryIO, stream: bool) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers["Content-Type"] = "application/json"
+        if stream:
+            response.raw = file
+        else:
+            with file:
+                response._content = file.read()
+        return response
+
+    def evict(self):
+        """
+        removes the least recently used responses until the size of the cache
+        is below the low water mark, keeping the response added last.
+        """
+        while len(self.entries) > 1 and self.size > self.max_size * self.low_water:
+            filename, size = self.entries.popitem(last=False)
+            log.debug("evicting %s from the response cache", filename)
+            self.size -= size
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    def __str__(self):
+        return f"{self.hits} cached responses, {self.misses} misses"
@@ -4,6 +4,8 @@ import click
 import os
 
 from datadog_export.events import main as export_events
+from datadog_export.fanout import main as export_fan_out
+from datadog_export.jobs import main as export_jobs
 from datadog_export.metrics import main as export_metrics
 from datadog_export.names import main as export_names
 
@@ -16,6 +18,8 @@ def main():
 main.add_command(export_names)
 main.add_command(export_metrics)
 main.add_command(export_events)
+main.add_command(export_fan_out)
+main.add_command(export_jobs)
 
 
 if __name__ == "__main__":
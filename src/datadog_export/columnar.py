@@ -0,0 +1,82 @@
+from typing import BinaryIO
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class ColumnarWriter(object):
+    """
+    writes the points of metric query responses as the columns `timestamp`,
+    `value`, `metric`, `scope` and `tag_set` in Parquet or Arrow IPC stream
+    format. Each response is flushed as a separate row group or record batch,
+    and the metric, scope and tag_set columns are dictionary encoded.
+    """
+
+    formats = ["parquet", "arrow"]
+
+    def __init__(self, stream: BinaryIO, format: str = "parquet"):
+        if pyarrow is None:
+            raise ImportError(
+                f"the {format} format requires pyarrow, install datadog-exporter[columnar]"
+            )
+        self.format = format
+        self.schema = pyarrow.schema(
+            [
+                ("timestamp", pyarrow.timestamp("ms", tz="UTC")),
+                ("value", pyarrow.float64()),
+                ("metric", pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+                ("scope", pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+                ("tag_set", pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+            ]
+        )
+        if format == "parquet":
+            self.writer = pyarrow.parquet.ParquetWriter(
+                stream, self.schema, use_dictionary=True
+            )
+        else:
+            self.writer = pyarrow.ipc.new_stream(stream, self.schema)
+
+    def table(self, response: dict) -> "pyarrow.Table":
+        timestamps, values, indices = [], [], []
+        metrics, scopes, tag_sets = [], [], []
+        for i, s in enumerate(response["series"]):
+            metrics.append(s.get("metric"))
+            scopes.append(s.get("scope"))
+            tag_sets.append(",".join(s.get("tag_set", [])))
+            for timestamp, value in s["pointlist"]:
+                timestamps.append(int(timestamp))
+                values.append(value)
+            indices.extend([i] * len(s["pointlist"]))
+
+        indices = pyarrow.array(indices, type=pyarrow.int32())
+        return pyarrow.Table.from_arrays(
+            [
+                pyarrow.array(timestamps, type=self.schema.field("timestamp").type),
+                pyarrow.array(values, type=pyarrow.float64()),
+                pyarrow.DictionaryArray.from_arrays(
+                    indices, pyarrow.array(metrics, type=pyarrow.string())
+                ),
+                pyarrow.DictionaryArray.from_arrays(
+                    indices, pyarrow.array(scopes, type=pyarrow.string())
+                ),
+                pyarrow.DictionaryArray.from_arrays(
+                    indices, pyarrow.array(tag_sets, type=pyarrow.string())
+                ),
+            ],
+            schema=self.schema,
+        )
+
+    def write(self, response: dict):
+        table = self.table(response)
+        if table.num_rows:
+            if self.format == "parquet":
+                self.writer.write_table(table, row_group_size=table.num_rows)
+            else:
+                self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
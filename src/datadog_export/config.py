@@ -1,7 +1,7 @@
 import os
-from configparser import ConfigParser
+from configparser import ConfigParser, NoSectionError
 from os import path
-from datadog_export.logger import log
+from datadog_export.errors import ConfigurationError
 
 from datadog import initialize
 
@@ -51,21 +51,29 @@ def read(section: str = "DEFAULT"):
 
 
 def connect(section: str = "DEFAULT") -> dict:
-    kwargs = read(section)
+    try:
+        kwargs = read(section)
+    except NoSectionError:
+        raise ConfigurationError(f"section {section} missing from ~/.datadog.ini")
 
     if kwargs.get("api_key") and kwargs.get("app_key"):
         initialize(**kwargs)
     else:
-        log.error(
+        raise ConfigurationError(
             f"api_key/app_key missing from the environment and ~/.datadog.ini in the section {section}"
         )
-        exit(1)
     return kwargs
 
 
 def get_headers(section: str = "DEFAULT") -> dict:
+    return to_headers(read(section))
+
+
+def to_headers(configuration: dict) -> dict:
+    """
+    returns the Datadog API request headers for the credentials in `configuration`.
+    """
     result = {}
-    configuration = read(section)
     for name, header in [("api_key", "DD-API-KEY"), ("app_key", "DD-APPLICATION-KEY")]:
         if configuration.get(name):
             result[header] = configuration.get(name)
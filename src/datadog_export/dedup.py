@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from datadog_export.logger import log
+
+
+class EventDeduplicator(object):
+    """
+    emits each aggregated event once, although it is returned for every
+    window in which it or one of its children happened.
+
+    An event is held until a window no longer returns it, merging the
+    children of every occurrence. Once emitted, its id and the ids of its
+    children are remembered until events `horizon` seconds later have been
+    added. A late reappearance is dropped, unless it has new children: then
+    the event is emitted again with only the new children. Memory is bounded
+    by the events of the current window and the events emitted within the
+    horizon.
+    """
+
+    def __init__(self, horizon: float = 24 * 3600):
+        self.horizon = horizon
+        self.pending: Dict[int, dict] = OrderedDict()
+        self.seen: Dict[int, Tuple[float, Set]] = OrderedDict()
+        self.clock = 0.0
+        self.duplicates = 0
+        self.reappeared = 0
+
+    @staticmethod
+    def merge(previous: dict, event: dict) -> dict:
+        """
+        returns the `event` with the children of the `previous` occurrence
+        it does not contain.
+        """
+        children = {c.get("id"): c for c in previous.get("children", [])}
+        children.update({c.get("id"): c for c in event.get("children", [])})
+        result = dict(event)
+        if children:
+            result["children"] = sorted(
+                children.values(),
+                key=lambda c: c.get("date_happened", 0),
+                reverse=True,
+            )
+        return result
+
+    def add(self, events: List[dict]) -> List[dict]:
+        """
+        adds the `events` of the next window, and returns the events which
+        are complete: the pending events which are not in this window.
+        """
+        result = []
+        current = set()
+        for event in events:
+            id = event.get("id")
+            if id is None:
+                result.append(event)
+                continue
+            if id in self.seen:
+                event = self.unseen(event)
+                if event is None:
+                    self.duplicates += 1
+                    log.debug(f"dropping event {id}, which was already exported")
+                    continue
+            previous = self.pending.get(id)
+            self.pending[id] = self.merge(previous, event) if previous else event
+            current.add(id)
+            self.clock = max(self.clock, event.get("date_happened", 0))
+
+        for id in [id for id in self.pending if id not in current]:
+            result.append(self.emitted(self.pending.pop(id)))
+        self.evict()
+        return result
+
+    def flush(self) -> List[dict]:
+        """
+        returns all pending events.
+        """
+        result = [self.emitted(event) for event in self.pending.values()]
+        self.pending = OrderedDict()
+        return result
+
+    def unseen(self, event: dict) -> Optional[dict]:
+        """
+        returns the already emitted `event` with only the children which were
+        not emitted, or None if there are none.
+        """
+        _, children = self.seen[event["id"]]
+        unseen = [c for c in event.get("children", []) if c.get("id") not in children]
+        if not unseen:
+            return None
+        if event["id"] not in self.pending:
+            self.reappeared += 1
+            log.debug(f"event {event['id']} reappeared with {len(unseen)} new children")
+        result = dict(event)
+        result["children"] = unseen
+        return result
+
+    def emitted(self, event: dict) -> dict:
+        _, children = self.seen.pop(event["id"], (None, set()))
+        children.update(c.get("id") for c in event.get("children", []))
+        self.seen[event["id"]] = (self.clock, children)
+        return event
+
+    def evict(self):
+        """
+        forgets the events last emitted more than `horizon` seconds before the
+        latest event. As the clock never decreases, these are the oldest entries.
+        """
+        seen = self.seen
+        while seen and next(iter(seen.values()))[0] < self.clock - self.horizon:
+            seen.popitem(last=False)
@@ -0,0 +1,140 @@
+import re
+from array import array
+from math import floor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from datadog_export.series import Series
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    returns the `q`th percentile of the sorted `values`, interpolating
+    linearly between the closest ranks.
+    """
+    rank = q / 100 * (len(values) - 1)
+    lower = floor(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+class Bucket(object):
+    """
+    the aggregates of the points of a series in the current interval.
+    """
+
+    __slots__ = ("start", "count", "sum", "min", "max", "values")
+
+    def __init__(self, start: int, keep_values: bool):
+        self.start = start
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.values = array("d") if keep_values else None
+
+    def add(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if self.values is not None:
+            self.values.append(value)
+
+    def aggregate(self, aggregation: str) -> Optional[float]:
+        if aggregation == "count":
+            return float(self.count)
+        if not self.count:
+            return None
+        if aggregation == "avg":
+            return self.sum / self.count
+        if aggregation == "sum":
+            return self.sum
+        if aggregation == "min":
+            return self.min
+        if aggregation == "max":
+            return self.max
+        return percentile(sorted(self.values), float(aggregation[1:]))
+
+
+class Downsampler(object):
+    """
+    aggregates the points of each series into buckets of `interval` seconds,
+    aligned to the epoch, with each of the `aggregations`: avg, sum, min, max,
+    count or a percentile like p95.
+
+    Responses are added window by window. A bucket is emitted once a point
+    of a later bucket arrives, so buckets spanning a window boundary are
+    carried over to the next window. Points which do not lie after the last
+    point of the series are skipped, as they were part of the previous window.
+    Only the current bucket of each series is held in memory, with its values
+    when a percentile is requested.
+    """
+
+    pattern = re.compile(r"avg|sum|min|max|count|p(100|[1-9]?[0-9](\.[0-9]+)?)")
+
+    def __init__(self, interval: int, aggregations: List[str]):
+        for aggregation in aggregations:
+            if not self.pattern.fullmatch(aggregation):
+                raise ValueError(f"unknown aggregation {aggregation}")
+        self.interval = interval
+        self.aggregations = aggregations
+        self.keep_values = any(a.startswith("p") for a in aggregations)
+        self.series: Dict[Tuple[str, str, str], Tuple[dict, Bucket, float]] = {}
+        self.envelopes: Dict[str, dict] = {}
+
+    def add(self, response: dict) -> dict:
+        """
+        adds the series of the `response`, and returns the response with the
+        buckets completed.
+        """
+        query = response.get("query")
+        self.envelopes[query] = {k: v for k, v in response.items() if k != "series"}
+        result = dict(self.envelopes[query])
+        result["series"] = []
+        for s in response["series"]:
+            key = (query, s.get("metric"), s.get("scope"))
+            attributes, bucket, last = self.series.get(key, (None, None, None))
+            if attributes is None:
+                attributes = {k: v for k, v in s.items() if k != "pointlist"}
+            completed = []
+            for timestamp, value in s["pointlist"]:
+                if last is not None and timestamp <= last:
+                    continue
+                last = timestamp
+                start = int(timestamp // 1000) // self.interval * self.interval
+                if bucket is None or start != bucket.start:
+                    if bucket is not None:
+                        completed.append(bucket)
+                    bucket = Bucket(start, self.keep_values)
+                if value is not None:
+                    bucket.add(value)
+            self.series[key] = (attributes, bucket, last)
+            result["series"].extend(self.aggregate(query, attributes, completed))
+        return result
+
+    def flush(self) -> Iterator[dict]:
+        """
+        yields a response per query with the remaining incomplete buckets.
+        """
+        for query, envelope in self.envelopes.items():
+            result = dict(envelope)
+            result["series"] = []
+            for key in [k for k in self.series if k[0] == query]:
+                attributes, bucket, _ = self.series.pop(key)
+                if bucket is not None:
+                    result["series"].extend(self.aggregate(query, attributes, [bucket]))
+            if result["series"]:
+                yield result
+        self.envelopes = {}
+
+    def aggregate(
+        self, query: str, attributes: dict, buckets: List[Bucket]
+    ) -> Iterator[dict]:
+        if not buckets:
+            return
+        for aggregation in self.aggregations:
+            series = Series(attributes, query)
+            series.interval = self.interval
+            series.attributes["rollup"] = aggregation
+            series.extend([b.start * 1000.0, b.aggregate(aggregation)] for b in buckets)
+            yield series.to_dict()
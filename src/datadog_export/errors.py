@@ -0,0 +1,38 @@
+import requests
+
+
+class ExportError(Exception):
+    """
+    base class of the errors raised by an export.
+    """
+
+
+class ConfigurationError(ExportError):
+    """
+    the account is not configured with the required credentials.
+    """
+
+
+class APIError(ExportError):
+    """
+    the Datadog API returned an unexpected status code for the `response`.
+    """
+
+    def __init__(self, response: requests.Response):
+        super(APIError, self).__init__(
+            f"{response.request.url} returned {response.status_code}, {response.text}"
+        )
+        self.response = response
+        self.status_code = response.status_code
+
+
+class QueryError(ExportError):
+    """
+    the Datadog API reported an error in the body of the response.
+    """
+
+
+class RetryError(ExportError):
+    """
+    a transient error persisted after the retries of an API call.
+    """
@@ -1,14 +1,19 @@
+import json
 from datadog_export.logger import log
-from copy import deepcopy
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
 
 import click
 import pytz
 import requests
 from re import Pattern, compile
 from datadog_export import click_argument_types
+from datadog_export.cache import ResponseCache
+from datadog_export.dedup import EventDeduplicator
+from datadog_export.errors import ExportError
 from datadog_export.exporter import Exporter
+from datadog_export.output import Output
+from datadog_export.state import StateFile
 from durations import Duration
 
 
@@ -27,6 +32,13 @@ class EventsExporter(Exporter):
         self.priority: str = None
         self.query = None
         self.pattern: Pattern = None
+        self.adaptive = True
+        self.max_events = 1000
+        self.max_response_size = 32 * 1024 * 1024
+        self.max_window: Duration = Duration("7d")
+        self.window_size = timedelta(seconds=window.to_seconds())
+        self.deduplicate = True
+        self.deduplicator = EventDeduplicator()
 
     def export_started(self):
         log.info(
@@ -34,17 +46,18 @@ class EventsExporter(Exporter):
         )
 
     def convert_to_timestamps(self, response):
+        """
+        converts the timestamps in the `response` to iso format, in place.
+        """
         if not self.iso_date_formats:
             return response
 
-        r = deepcopy(response)
-        for e in r.get("events", []):
-            e["date_happened"] = self.to_datetime(e["date_happened"] * 1000).isoformat()
+        to_isoformat = self.to_isoformat
+        for e in response.get("events", []):
+            e["date_happened"] = to_isoformat(e["date_happened"] * 1000)
             for c in e.get("children", []):
-                c["date_happened"] = self.to_datetime(
-                    c["date_happened"] * 1000
-                ).isoformat()
-        return r
+                c["date_happened"] = to_isoformat(c["date_happened"] * 1000)
+        return response
 
     def event_matched(self, event):
         return (
@@ -53,15 +66,134 @@ class EventsExporter(Exporter):
             or self.pattern.findall(event.get("text", ""))
         )
 
-    def process(self, response):
+    def records(self, response: dict) -> Iterator[dict]:
+        return iter(response["events"])
+
+    def matching(self, response: dict) -> dict:
+        """
+        returns the `response` with only the events matching the pattern.
+        """
         before = len(response["events"])
         response["events"] = list(filter(self.event_matched, response["events"]))
         after = len(response["events"])
         if self.pattern:
             log.info(f"{after} out of {before} events matched")
-        r = self.convert_to_timestamps(response)
+        return response
+
+    def deduplicating(self) -> bool:
+        return self.aggregated and self.deduplicate
+
+    def unique(self, response: dict) -> dict:
+        """
+        returns the `response` with the aggregated events which are complete,
+        each emitted once over the export.
+        """
+        if self.deduplicating():
+            response["events"] = self.deduplicator.add(response["events"])
+        return response
+
+    def events(self) -> Iterator[dict]:
+        """
+        yields the matching events of the export lazily, window by window.
+        """
+        for document in self.iterate():
+            events = self.unique(self.matching(document))["events"]
+            self.stats.count("events", len(events))
+            yield from events
+        if self.deduplicating():
+            events = self.deduplicator.flush()
+            self.stats.count("events", len(events))
+            yield from events
+
+    def process(self, response):
+        response = self.unique(self.matching(response))
+        self.stats.count("events", len(response["events"]))
+        with self.stats.stage("convert"):
+            r = self.convert_to_timestamps(response)
         self.write(r)
 
+    def flush(self):
+        if not self.deduplicating():
+            return
+        events = self.deduplicator.flush()
+        if events:
+            self.stats.count("events", len(events))
+            self.write(self.convert_to_timestamps({"events": events}))
+        if self.deduplicator.duplicates:
+            log.info(f"{self.deduplicator.duplicates} duplicate events dropped")
+        if self.deduplicator.reappeared:
+            log.warning(
+                f"{self.deduplicator.reappeared} events reappeared after they were "
+                "written, and were written again with their new children"
+            )
+
+    def windows(
+        self, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None
+    ) -> Iterator[Tuple[datetime, datetime]]:
+        """
+        yields windows of the adaptive `window_size`, capped at the `end_time`.
+        """
+        if not self.adaptive:
+            yield from super(EventsExporter, self).windows(start_time, end_time)
+            return
+
+        st = start_time if start_time else self.start_time
+        end_time = end_time if end_time else self.end_time
+        while st < end_time:
+            et = min(st + self.window_size, end_time)
+            yield st, et
+            st = et
+
+    def documents(
+        self, st: datetime, et: datetime, response: requests.Response
+    ) -> Iterator[dict]:
+        """
+        yields the events of the `response`. In adaptive mode, a window for
+        which the response reaches `max_events` or `max_response_size` is
+        split in two and refetched, while the window size is doubled after a
+        quiet window.
+        """
+        if not self.adaptive or response.status_code != 200:
+            yield from super(EventsExporter, self).documents(st, et, response)
+            return
+
+        splittable = et - st >= timedelta(seconds=2)
+        if splittable and len(response.content) > self.max_response_size:
+            yield from self.split(
+                st, et, f"response exceeds {self.max_response_size} bytes"
+            )
+            return
+
+        events = response.json()
+        if splittable and len(events.get("events", [])) >= self.max_events:
+            yield from self.split(st, et, f"response reached {self.max_events} events")
+            return
+
+        if len(events.get("events", [])) >= self.max_events:
+            log.warning(f"events from {st} to {et} may be truncated")
+        elif len(events.get("events", [])) < self.max_events / 4:
+            max_window = timedelta(seconds=self.max_window.to_seconds())
+            self.window_size = min(max(self.window_size, et - st) * 2, max_window)
+
+        yield events
+
+    def split(self, st: datetime, et: datetime, reason: str) -> Iterator[dict]:
+        middle = st + timedelta(seconds=int((et - st).total_seconds() / 2))
+        log.info(f"splitting window from {st} to {et}, as the {reason}")
+        self.window_size = min(self.window_size, middle - st)
+        for s, e in [(st, middle), (middle, et)]:
+            yield from self.documents(s, e, self.fetch(s, e))
+
+    def state_key(self) -> Optional[str]:
+        filters = {
+            "sources": sorted(self.sources),
+            "tags": sorted(self.tags),
+            "priority": self.priority,
+            "aggregated": self.aggregated,
+            "pattern": self.pattern.pattern if self.pattern else None,
+        }
+        return f"{self.account}:events:{json.dumps(filters, sort_keys=True)}"
+
     def _get(self, st: datetime, et: datetime) -> requests.Response:
         params = {
             "start": int(st.timestamp()),
@@ -78,10 +210,10 @@ class EventsExporter(Exporter):
         if self.priority:
             params["priority"] = self.priority
 
-        return requests.get(
-            "https://api.datadoghq.com/api/v1/events",
-            headers=self.get_headers(),
+        return self.get(
+            f"{self.api_host}/api/v1/events",
             params=params,
+            until=et,
         )
 
 
@@ -91,9 +223,9 @@ class EventsExporter(Exporter):
 )
 @click.option(
     "--start-time",
-    required=True,
+    required=False,
     type=click_argument_types.DateTime(),
-    help="of the export. either a duration, date or timestamp",
+    help="of the export. either a duration, date or timestamp. required without --state-file",
 )
 @click.option(
     "--end-time",
@@ -109,6 +241,19 @@ class EventsExporter(Exporter):
     type=click_argument_types.Duration(),
     help="size of an export window, default 24h",
 )
+@click.option(
+    "--adaptive-window/--fixed-window",
+    required=False,
+    default=True,
+    help="split windows with too many events and grow the window in quiet periods, default adaptive",
+)
+@click.option(
+    "--max-window",
+    required=False,
+    default=Duration("7d"),
+    type=click_argument_types.Duration(),
+    help="size an adaptive window may grow to, default 7d",
+)
 @click.option(
     "--iso-datetime/--no-iso-datetime",
     required=False,
@@ -121,6 +266,131 @@ class EventsExporter(Exporter):
     default=False,
     help="output json in pretty print",
 )
+@click.option(
+    "--format",
+    "output_format",
+    required=False,
+    default="json",
+    type=click.Choice(["json", "ndjson"]),
+    help="of the output, a json document per window or a json line per event. default json",
+)
+@click.option(
+    "--output",
+    required=False,
+    help="file or s3://bucket/key to write the export to, default stdout",
+)
+@click.option(
+    "--compress",
+    required=False,
+    type=click.Choice(Output.compressions),
+    help="the output with gzip or zstd",
+)
+@click.option(
+    "--rotate-size",
+    required=False,
+    default=0,
+    type=click.IntRange(min=0),
+    help="rotate the output file after a window once it exceeds this size in MB",
+)
+@click.option(
+    "--rotate-windows",
+    required=False,
+    default=0,
+    type=click.IntRange(min=0),
+    help="rotate the output file after this number of windows",
+)
+@click.option(
+    "--s3-in-flight",
+    required=False,
+    default=4,
+    type=click.IntRange(min=1),
+    help="maximum number of parts uploading concurrently to an s3:// output, default 4",
+)
+@click.option(
+    "--concurrency",
+    required=False,
+    default=1,
+    type=click.IntRange(min=1),
+    help="number of windows to fetch in parallel, default 1",
+)
+@click.option(
+    "--pool-size",
+    required=False,
+    default=10,
+    type=click.IntRange(min=1),
+    help="maximum number of connections kept alive, default 10",
+)
+@click.option(
+    "--timeout",
+    required=False,
+    default=60.0,
+    type=click.FloatRange(min=0, min_open=True),
+    help="of an API call in seconds, default 60",
+)
+@click.option(
+    "--max-retries",
+    required=False,
+    default=5,
+    type=click.IntRange(min=0),
+    help="of an API call failing with a 5xx, connection error or timeout, default 5",
+)
+@click.option(
+    "--retry-budget",
+    required=False,
+    default=100,
+    type=click.IntRange(min=0),
+    help="maximum number of retries of the export, default 100",
+)
+@click.option(
+    "--cache-dir",
+    required=False,
+    type=click.Path(file_okay=False),
+    help="to cache the responses of windows in the past, default no cache",
+)
+@click.option(
+    "--cache-size",
+    required=False,
+    default=1024,
+    type=click.IntRange(min=1),
+    help="maximum size of the response cache in MB, default 1024",
+)
+@click.option(
+    "--state-file",
+    required=False,
+    type=click.Path(dir_okay=False),
+    help="to record the last exported window in, and resume from",
+)
+@click.option(
+    "--follow/--no-follow",
+    required=False,
+    default=False,
+    help="keep exporting new windows as soon as they are closed",
+)
+@click.option(
+    "--lag",
+    required=False,
+    default=Duration("1m"),
+    type=click_argument_types.Duration(),
+    help="to wait for late data before a closed window is exported in follow mode, default 1m",
+)
+@click.option(
+    "--stats-file",
+    required=False,
+    type=click.Path(dir_okay=False),
+    help="to write the statistics of the export to, in the Prometheus textfile format if it ends with .prom, otherwise json",
+)
+@click.option(
+    "--profile",
+    required=False,
+    type=click.Path(dir_okay=False),
+    help="file to write a cProfile profile of the export to",
+)
+@click.option(
+    "--trace-memory/--no-trace-memory",
+    required=False,
+    default=False,
+    help="trace the peak memory and largest allocations with tracemalloc",
+)
 @click.option(
     "--source", required=False, type=str, multiple=True, help="to filter events on"
 )
@@ -133,6 +403,19 @@ class EventsExporter(Exporter):
     type=click.Choice(["low", "normal"]),
     help="to filter events on",
 )
+@click.option(
+    "--dedup/--no-dedup",
+    required=False,
+    default=None,
+    help="write each aggregated event once, with the children of all windows, default dedup without --state-file",
+)
+@click.option(
+    "--dedup-horizon",
+    required=False,
+    default=Duration("24h"),
+    type=click_argument_types.Duration(),
+    help="to remember written aggregated events for, default 24h",
+)
 @click.option(
     "--aggregated/--unaggregated",
     required=False,
@@ -149,27 +432,92 @@ def main(
     start_time: datetime,
     end_time: datetime,
     window: Duration,
+    adaptive_window: bool,
+    max_window: Duration,
     iso_datetime: bool,
     pretty_print: bool,
+    output_format: str,
+    output: Optional[str],
+    compress: Optional[str],
+    rotate_size: int,
+    rotate_windows: int,
+    s3_in_flight: int,
+    concurrency: int,
+    pool_size: int,
+    timeout: float,
+    max_retries: int,
+    retry_budget: int,
+    cache_dir: Optional[str],
+    cache_size: int,
+    state_file: Optional[str],
+    follow: bool,
+    lag: Duration,
+    stats_file: Optional[str],
+    profile: Optional[str],
+    trace_memory: bool,
     source: Optional[List[str]],
     tag: Optional[List[str]],
     priority: Optional[str],
+    dedup: Optional[bool],
+    dedup_horizon: Duration,
     aggregated: bool,
     pattern: Optional[Pattern],
 ):
     """
     export datadog events.
     """
+    if not start_time and not state_file:
+        raise click.UsageError(
+            "Missing option '--start-time', required without --state-file."
+        )
+    if dedup and state_file:
+        raise click.UsageError("--dedup cannot be combined with --state-file.")
+
     exporter = EventsExporter(account, start_time, end_time, window)
+    exporter.adaptive = adaptive_window
+    exporter.max_window = max_window
     exporter.iso_date_formats = iso_datetime
     exporter.pretty_print = pretty_print
+    exporter.format = output_format
+    exporter.concurrency = concurrency
+    exporter.pool_size = pool_size
+    exporter.timeout = timeout
+    exporter.retry.max_retries = max_retries
+    exporter.retry.budget = retry_budget
+    if cache_dir:
+        exporter.cache = ResponseCache(cache_dir, cache_size * 1024 * 1024)
+    if state_file:
+        exporter.state = StateFile(state_file)
+    exporter.follow = follow
+    exporter.lag = lag
+    exporter.stats_file = stats_file
+    exporter.profile = profile
+    exporter.trace_memory = trace_memory
     exporter.sources = source
     exporter.tags = tag
     exporter.priority = priority
     exporter.aggregated = aggregated
+    exporter.deduplicate = not state_file if dedup is None else dedup
+    exporter.deduplicator.horizon = dedup_horizon.to_seconds()
     exporter.pattern = pattern
-    exporter.connect()
-    exporter.export()
+    try:
+        exporter.open_output(
+            output, compress, rotate_size * 1024 * 1024, rotate_windows, s3_in_flight
+        )
+    except (ImportError, ValueError) as e:
+        log.error(e)
+        exit(1)
+
+    completed = False
+    try:
+        exporter.connect()
+        exporter.export()
+        completed = True
+    except ExportError as e:
+        log.error(e)
+        exit(1)
+    finally:
+        exporter.close(failed=not completed)
 
 
 if __name__ == "__main__":
@@ -1,31 +1,28 @@
+import io
 import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datadog_export.logger import log
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Iterable, Iterator, Optional, TextIO, Tuple
 
 import pytz
 import requests
+from requests.adapters import HTTPAdapter
 import sys
-from datadog_export.config import connect, get_headers
+from time import monotonic, sleep
+from datadog_export.cache import ResponseCache
+from datadog_export.config import connect, get_headers, to_headers
+from datadog_export.errors import APIError, RetryError
+from datadog_export.output import Output
+from datadog_export.ratelimit import RateLimit, RateLimitScheduler
+from datadog_export.retry import RetryPolicy
+from datadog_export.state import StateFile
+from datadog_export.stats import Stats
 from durations import Duration
 
 
-class RateLimit(object):
-    def __init__(self, headers: dict):
-        self.limit = int(headers.get("X-RateLimit-Limit", "0"))
-        self.remaining = int(headers.get("X-RateLimit-Remaining", "0"))
-        self.period = int(headers.get("X-RateLimit-Period", "0"))
-        self.reset = int(headers.get("X-RateLimit-Reset", "0"))
-
-    def __str__(self):
-        if self.limit:
-            return "rate limit of {limit} API calls per {period}s. {remaining} remaining, reset in {reset}s".format(
-                **self.__dict__
-            )
-        else:
-            return ""
-
-
 class Exporter(object):
     def __init__(
         self,
@@ -36,16 +33,60 @@ class Exporter(object):
     ):
         super(Exporter, self).__init__()
         self.ratelimit = RateLimit({})
+        self.scheduler = RateLimitScheduler()
+        self.retry = RetryPolicy()
         self.account: str = account if account else "DEFAULT"
         self.window: Duration = window
         self.end_time: datetime = end_time
         self.start_time: datetime = start_time
         self.iso_date_formats = False
         self.pretty_print = False
-        self.metrics = []
+        self.format = "json"
+        self.output: TextIO = sys.stdout
+        self.sink: Optional[Output] = None
+        self.concurrency = 1
+        self.streaming = False
+        self.pool_size = 10
+        self.timeout = 60.0
+        self.api_host = "https://api.datadoghq.com"
+        self.headers: Optional[dict] = None
+        self._session: Optional[requests.Session] = None
+        self.cache: Optional[ResponseCache] = None
+        self.state: Optional[StateFile] = None
+        self.follow = False
+        self.lag: Duration = Duration("0s")
+        self.stats = Stats()
+        self.stats_file: Optional[str] = None
+        self.profile: Optional[str] = None
+        self.trace_memory = False
 
     def connect(self):
-        connect(self.account)
+        configuration = connect(self.account)
+        self.headers = to_headers(configuration)
+        if configuration.get("api_host"):
+            self.api_host = configuration["api_host"].rstrip("/")
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        the HTTP session shared by all requests of the export, keeping up to
+        `pool_size` or `concurrency` connections alive. An injected session is
+        used as is, with the request headers of the account added to each request.
+        """
+        if not self._session:
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=max(self.pool_size, self.concurrency)
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(self.get_headers())
+            self._session = session
+        return self._session
+
+    @session.setter
+    def session(self, session: Optional[requests.Session]):
+        self._session = session
 
     @property
     def start_time(self) -> datetime:
@@ -60,6 +101,7 @@ class Exporter(object):
     @start_time.setter
     def start_time(self, start_time):
         self._start_time = start_time.astimezone(pytz.UTC) if start_time else None
+        self.start_time_given = start_time is not None
 
     @property
     def end_time(self) -> datetime:
@@ -79,8 +121,105 @@ class Exporter(object):
             rate_limit.reset,
         )
 
-    def get_headers(self):
-        return get_headers(self.account)
+    def get_headers(self) -> dict:
+        if self.headers is None:
+            self.headers = get_headers(self.account)
+        return self.headers
+
+    def get(
+        self, url: str, params: dict, until: Optional[datetime] = None
+    ) -> requests.Response:
+        """
+        gets the `url` paced by the scheduler, retrying after the reset when
+        the rate limit is exceeded, and retrying transient errors as allowed
+        by the retry policy. If the requested data ends `until` a time in the
+        past, the response is served from and stored in the cache. When
+        streaming, a cached response is parsed from the cache file.
+        """
+        cacheable = (
+            self.cache is not None
+            and until is not None
+            and until <= datetime.now().astimezone(pytz.UTC)
+        )
+        if cacheable:
+            response = self.cache.get(self.account, url, params, self.streaming)
+            if response:
+                self.stats.count("cache_hits")
+                return response
+
+        attempt = 0
+        while True:
+            with self.stats.stage("throttle"):
+                self.scheduler.acquire()
+            started = monotonic()
+            try:
+                with self.stats.stage("download"):
+                    response = self.session.get(
+                        url,
+                        params=params,
+                        headers=self.get_headers(),
+                        timeout=self.timeout,
+                        stream=self.streaming,
+                    )
+            except Exception as e:
+                if not self.retry.transient(error=e):
+                    raise
+                if self.retry_failed(attempt, f"{url} failed, {e}"):
+                    attempt += 1
+                    continue
+                raise RetryError(f"{url} failed after {attempt} retries, {e}") from e
+
+            self.stats.move("download", "wait", response.elapsed.total_seconds())
+            self.stats.count("requests")
+            self.stats.count(
+                "bytes",
+                (
+                    int(response.headers.get("Content-Length", 0))
+                    if self.streaming
+                    else len(response.content)
+                ),
+            )
+            self.ratelimit = RateLimit(response.headers)
+            self.scheduler.update(self.ratelimit, monotonic() - started)
+            if response.status_code == 429:
+                self.export_rate_limit_exceeded(response)
+                self.scheduler.exceeded(self.ratelimit)
+                self.stats.count("retries")
+            elif self.retry.transient(response):
+                reason = f"{url} returned {response.status_code}"
+                if not self.retry_failed(attempt, reason):
+                    break
+                attempt += 1
+            else:
+                self.retry.record(False)
+                break
+
+        if cacheable and response.status_code == 200:
+            response = self.cache.put(
+                self.account, url, params, response, self.streaming
+            )
+        return response
+
+    def retry_failed(self, attempt: int, reason: str) -> bool:
+        """
+        registers a transient failure of a call which failed `attempt` times
+        before, and backs off if it may be retried. When the circuit breaker
+        opens, all calls are held for the cooldown of the retry policy.
+        """
+        if self.retry.record(True):
+            log.warning(
+                f"too many failing API calls, holding all calls for {self.retry.cooldown}s"
+            )
+            self.scheduler.hold(self.retry.cooldown)
+        if not self.retry.allow(attempt):
+            return False
+
+        delay = self.retry.delay(attempt)
+        log.warning(f"{reason}, retry {attempt + 1} in {delay:.1f}s")
+        self.stats.count("retries")
+        with self.stats.stage("throttle"):
+            sleep(delay)
+        return True
 
     def _get(self, st: datetime, et: datetime) -> requests.Response:
         raise Exception("not implemented")
@@ -91,42 +230,235 @@ class Exporter(object):
         result = result + timedelta(microseconds=ts % 1000)
         return result
 
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def to_isoformat(ts: float) -> str:
+        """
+        returns `to_datetime(ts)` in iso format. the result is cached, as the
+        series of a response share most of their timestamps.
+        """
+        return Exporter.to_datetime(ts).isoformat()
+
+    def records(self, response: dict) -> Iterator[dict]:
+        """
+        flattens the `response` into the records written by the ndjson format.
+        """
+        yield response
+
     def write(self, response):
+        self.dump(response, self.output)
+
+    def dump(self, response, output: TextIO):
+        if self.format == "ndjson":
+            for record in self.records(response):
+                output.write(json.dumps(record))
+                output.write("\n")
+            return
+
         kwargs = {}
         if self.pretty_print:
             kwargs["indent"] = 2
-        json.dump(response, sys.stdout, **kwargs)
+        json.dump(response, output, **kwargs)
 
     def process(self, response: dict):
         self.write(response)
 
+    def open_output(
+        self,
+        filename: Optional[str] = None,
+        compress: Optional[str] = None,
+        max_size: int = 0,
+        max_windows: int = 0,
+        max_in_flight: int = 4,
+    ):
+        """
+        writes the output through a background writer to the `filename`, an
+        s3:// url or stdout, see `Output`. When resuming from a state file, the
+        output is appended.
+        """
+        self.sink = Output(
+            filename,
+            compress,
+            max_size,
+            max_windows,
+            append=self.state is not None,
+            variables=self.output_variables(),
+            max_in_flight=max_in_flight,
+        )
+        self.output = io.TextIOWrapper(
+            io.BufferedWriter(self.sink, buffer_size=1024 * 1024), encoding="utf-8"
+        )
+
+    def output_variables(self) -> dict:
+        """
+        the variables which may be used in the output filename.
+        """
+        return {"account": self.account}
+
+    def close(self, failed: bool = False):
+        """
+        completes the output, after all exports are done. If the export
+        `failed`, the output is aborted instead, see `Output.abort`.
+        """
+        if self.sink:
+            if failed:
+                self.sink.abort()
+            self.output.close()
+            self.sink = None
+        else:
+            self.output.flush()
+
     def export_started(self):
         log.info(
             f"exporting from {self.start_time} to {self.end_time} in {self.window} steps"
         )
 
     def export_completed(self):
-        log.info(f"export complete. {self.ratelimit}")
+        cached = f" {self.cache}." if self.cache else ""
+        log.info(f"export complete. {self.scheduler}.{cached} {self.ratelimit}")
+        log.info(f"{self.stats}")
+        if self.stats_file:
+            self.stats.write(self.stats_file, self.stats_labels())
+
+    def stats_labels(self) -> dict:
+        """
+        the labels identifying the export in the stats file.
+        """
+        return {"account": self.account, "exporter": type(self).__name__}
+
+    def state_key(self) -> Optional[str]:
+        """
+        identifies the export in the state file, None if it cannot be resumed.
+        """
+        return None
+
+    def resume_time(self) -> datetime:
+        """
+        returns the end of the last completed window in the state file, if it
+        lies after the start time of the export or no start time was given.
+        """
+        key = self.state_key() if self.state else None
+        resumed = self.state.get(key) if key else None
+        if resumed and (not self.start_time_given or resumed > self.start_time):
+            log.info(f"resuming export from {resumed}")
+            return resumed
+        return self.start_time
+
+    def window_completed(self, st: datetime, et: datetime):
+        self.stats.count("windows")
+        if self.sink:
+            with self.stats.stage("write"):
+                self.output.flush()
+        key = self.state_key() if self.state else None
+        if key:
+            self.state.update(key, et)
+
+    def windows(
+        self, start_time: Optional[datetime] = None, end_time: Optional[datetime] = None
+    ) -> Iterator[Tuple[datetime, datetime]]:
+        st = start_time if start_time else self.start_time
+        end_time = end_time if end_time else self.end_time
+        while st < end_time:
+            et = st + timedelta(seconds=self.window.to_seconds())
+            yield st, et
+            st = et
+
+    def fetch(self, st: datetime, et: datetime) -> requests.Response:
+        """
+        gets the window [st, et).
+        """
+        return self._get(st, et)
+
+    def responses(
+        self, windows: Iterable[Tuple[datetime, datetime]]
+    ) -> Iterator[Tuple[datetime, datetime, requests.Response]]:
+        """
+        fetches the `windows` with at most `concurrency` requests in flight,
+        and yields the windows and their responses in window order.
+        """
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            try:
+                for st, et in windows:
+                    pending.append((st, et, executor.submit(self.fetch, st, et)))
+                    if len(pending) >= self.concurrency:
+                        st, et, future = pending.popleft()
+                        yield st, et, future.result()
+                while pending:
+                    st, et, future = pending.popleft()
+                    yield st, et, future.result()
+            finally:
+                for _, _, future in pending:
+                    future.cancel()
+
+    def documents(
+        self, st: datetime, et: datetime, response: requests.Response
+    ) -> Iterator[dict]:
+        """
+        yields the parsed documents of the `response` for the window [st, et).
+        """
+        if response.status_code != 200:
+            self.failed(response)
+        yield response.json()
+
+    def failed(self, response: requests.Response):
+        raise APIError(response)
+
+    def iterate(self) -> Iterator[dict]:
+        """
+        yields the parsed documents of the export lazily, window by window,
+        without processing or writing them.
+        """
+        self.export_started()
+        with self.stats.measured():
+            for st, et, response in self.responses(self.windows(self.resume_time())):
+                yield from self.stats.timed("parse", self.documents(st, et, response))
+                self.window_completed(st, et)
+        self.export_completed()
+
+    def flush(self):
+        """
+        writes the output held back until all windows have been exported.
+        """
+        pass
+
+    def export_windows(self, windows: Iterable[Tuple[datetime, datetime]]):
+        for st, et, response in self.responses(windows):
+            if self.sink:
+                self.sink.rotate(st)
+            for document in self.stats.timed("parse", self.documents(st, et, response)):
+                with self.stats.stage("write"):
+                    self.process(document)
+            self.window_completed(st, et)
+
+    def follow_windows(self, start_time: datetime):
+        """
+        exports the windows from `start_time` onwards as soon as they have been
+        closed for `lag`, until interrupted.
+        """
+        window = timedelta(seconds=self.window.to_seconds())
+        lag = timedelta(seconds=self.lag.to_seconds())
+        st = start_time
+        try:
+            while True:
+                closed = datetime.now().astimezone(pytz.UTC) - lag
+                end_time = st + max(0, int((closed - st) / window)) * window
+                self.export_windows(self.windows(st, end_time))
+                st = end_time
+
+                delay = st + window + lag - datetime.now().astimezone(pytz.UTC)
+                if delay.total_seconds() > 0:
+                    log.debug(f"waiting {delay} for the window starting at {st}")
+                    sleep(delay.total_seconds())
+        except KeyboardInterrupt:
+            log.info(f"export interrupted, following stopped at {st}")
 
     def export(self):
         self.export_started()
-        st = self.start_time
-        while st < self.end_time:
-            et = st + timedelta(seconds=self.window.to_seconds())
-            response = self._get(st, et)
-            self.ratelimit = RateLimit(response.headers)
-            if response.status_code == 200:
-                self.process(response.json())
-                st = st + timedelta(seconds=self.window.to_seconds())
-
-            elif response.status_code != 429:
-                log.error(
-                    "%s for %s returned %s, %s",
-                    response.request.url,
-                    response.status_code,
-                    response.text,
-                )
-                exit(1)
+        with self.stats.measured(self.profile, self.trace_memory):
+            if self.follow:
+                self.follow_windows(self.resume_time())
             else:
-                self.export_rate_limit_exceeded(response)
+                self.export_windows(self.windows(self.resume_time()))
+            self.flush()
         self.export_completed()
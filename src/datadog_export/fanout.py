@@ -0,0 +1,263 @@
+import os
+from datetime import datetime
+from os import path
+from re import Pattern
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import click
+import pytz
+from durations import Duration
+
+from datadog_export import click_argument_types
+from datadog_export.cache import ResponseCache
+from datadog_export.columnar import ColumnarWriter
+from datadog_export.errors import ExportError
+from datadog_export.logger import log
+from datadog_export.metrics import MetricsExporter
+from datadog_export.names import MetricNamesExporter
+from datadog_export.state import StateFile
+
+
+class FanOutExporter(MetricsExporter):
+    """
+    exports a query per metric name, generated from the `template`, and
+    writes the output of each metric to a separate file in the `directory`.
+    """
+
+    def __init__(
+        self,
+        account: str,
+        start_time: Optional[datetime],
+        end_time: datetime,
+        window: Duration,
+        directory: str,
+    ):
+        super(FanOutExporter, self).__init__(account, start_time, end_time, window)
+        self.directory = directory
+        self.template = "avg:{metric}{*}"
+        self.metric_names: Dict[str, str] = {}
+        self.opened = set()
+        self.columnar_writers: Dict[str, Tuple[ColumnarWriter, BinaryIO]] = {}
+
+    def add_metric_names(self, names: List[str]):
+        for name in names:
+            query = self.template.replace("{metric}", name)
+            self.metric_names[query] = name
+            self.queries.append(query)
+
+    def filename(self, metric: str) -> str:
+        return path.join(self.directory, f"{metric}.{self.format}")
+
+    def write(self, response):
+        metric = self.metric_names[response["query"]]
+        filename = self.filename(metric)
+        if self.format in ColumnarWriter.formats:
+            if metric not in self.columnar_writers:
+                file = open(filename, "wb")
+                self.columnar_writers[metric] = (
+                    ColumnarWriter(file, self.format),
+                    file,
+                )
+            self.columnar_writers[metric][0].write(response)
+            return
+
+        mode = "a" if metric in self.opened or self.state else "w"
+        self.opened.add(metric)
+        with open(filename, mode) as output:
+            self.dump(response, output)
+
+    def close(self, failed: bool = False):
+        for writer, file in self.columnar_writers.values():
+            writer.close()
+            file.close()
+        self.columnar_writers = {}
+
+
+@click.command(name="fan-out")
+@click.option(
+    "--account", required=False, default="DEFAULT", help="name of the Datadog account."
+)
+@click.option(
+    "--pattern",
+    required=False,
+    default=".*",
+    type=click_argument_types.RegEx(),
+    help="regular expression of metrics to export, default .*",
+)
+@click.option("--host", required=False, multiple=True, help="to obtain metrics from")
+@click.option(
+    "--template",
+    required=False,
+    default="avg:{metric}{*}",
+    help="of the query for each metric, default avg:{metric}{*}",
+)
+@click.option(
+    "--output-dir",
+    required=True,
+    type=click.Path(file_okay=False),
+    help="to write the output of each metric to",
+)
+@click.option(
+    "--start-time",
+    required=False,
+    type=click_argument_types.DateTime(),
+    help="of the export. either a duration, date or timestamp. required without --state-file",
+)
+@click.option(
+    "--end-time",
+    required=False,
+    default=datetime.now().astimezone(pytz.UTC).replace(second=0, microsecond=0),
+    type=click_argument_types.DateTime(),
+    help="of the export. either a duration, date or timestamp. default now.",
+)
+@click.option(
+    "--window",
+    required=False,
+    default=Duration("24h"),
+    type=click_argument_types.Duration(),
+    help="size of an export window, default 24h",
+)
+@click.option(
+    "--iso-datetime/--no-iso-datetime",
+    required=False,
+    default=False,
+    help="output timestamps in iso format",
+)
+@click.option(
+    "--pretty-print/--no-pretty-print",
+    required=False,
+    default=False,
+    help="output json in pretty print",
+)
+@click.option(
+    "--format",
+    "output_format",
+    required=False,
+    default="json",
+    type=click.Choice(["json", "ndjson"] + ColumnarWriter.formats),
+    help="of the output, a json document per window, a json line per point or columns in parquet or arrow. default json",
+)
+@click.option(
+    "--max-query-length",
+    required=False,
+    default=2000,
+    type=click.IntRange(min=1),
+    help="of the queries combined in a single API call, default 2000",
+)
+@click.option(
+    "--concurrency",
+    required=False,
+    default=1,
+    type=click.IntRange(min=1),
+    help="number of windows to fetch in parallel, default 1",
+)
+@click.option(
+    "--pool-size",
+    required=False,
+    default=10,
+    type=click.IntRange(min=1),
+    help="maximum number of connections kept alive, default 10",
+)
+@click.option(
+    "--timeout",
+    required=False,
+    default=60.0,
+    type=click.FloatRange(min=0, min_open=True),
+    help="of an API call in seconds, default 60",
+)
+@click.option(
+    "--cache-dir",
+    required=False,
+    type=click.Path(file_okay=False),
+    help="to cache the responses of windows in the past, default no cache",
+)
+@click.option(
+    "--cache-size",
+    required=False,
+    default=1024,
+    type=click.IntRange(min=1),
+    help="maximum size of the response cache in MB, default 1024",
+)
+@click.option(
+    "--state-file",
+    required=False,
+    type=click.Path(dir_okay=False),
+    help="to record the last exported window in, and resume from",
+)
+def main(
+    account: str,
+    pattern: Pattern,
+    host: List[str],
+    template: str,
+    output_dir: str,
+    start_time: datetime,
+    end_time: datetime,
+    window: Duration,
+    iso_datetime: bool,
+    pretty_print: bool,
+    output_format: str,
+    max_query_length: int,
+    concurrency: int,
+    pool_size: int,
+    timeout: float,
+    cache_dir: Optional[str],
+    cache_size: int,
+    state_file: Optional[str],
+):
+    """
+    export the datadog metrics matching a pattern, per metric.
+    """
+    if not start_time and not state_file:
+        raise click.UsageError(
+            "Missing option '--start-time', required without --state-file."
+        )
+    if output_format in ColumnarWriter.formats and state_file:
+        raise click.UsageError(
+            f"the {output_format} format cannot be appended to, so it cannot be resumed with --state-file."
+        )
+
+    names = MetricNamesExporter(account, datetime(1970, 1, 1, tzinfo=pytz.UTC))
+    names.hosts = host
+    names.concurrency = concurrency
+    names.pool_size = pool_size
+    names.timeout = timeout
+    names.pattern = pattern
+    try:
+        names.connect()
+        metric_names = list(names.names())
+    except ExportError as e:
+        log.error(e)
+        exit(1)
+    if not metric_names:
+        log.error(f"no metrics found matching {pattern.pattern}")
+        exit(1)
+
+    exporter = FanOutExporter(account, start_time, end_time, window, output_dir)
+    exporter.template = template
+    exporter.add_metric_names(metric_names)
+    exporter.iso_date_formats = iso_datetime and output_format in ["json", "ndjson"]
+    exporter.pretty_print = pretty_print
+    exporter.format = output_format
+    exporter.max_query_length = max_query_length
+    exporter.concurrency = concurrency
+    exporter.timeout = timeout
+    exporter.api_host = names.api_host
+    exporter.headers = names.headers
+    exporter.session = names.session
+    if cache_dir:
+        exporter.cache = ResponseCache(cache_dir, cache_size * 1024 * 1024)
+    if state_file:
+        exporter.state = StateFile(state_file)
+
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        exporter.export()
+    except ExportError as e:
+        log.error(e)
+        exit(1)
+    finally:
+        exporter.close()
+
+
+if __name__ == "__main__":
+    main()
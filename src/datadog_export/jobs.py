@@ -0,0 +1,193 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+from multiprocessing import Manager
+from time import monotonic
+from typing import List, Optional
+
+import click
+import pytz
+from durations import Duration
+
+from datadog_export import click_argument_types
+from datadog_export.columnar import ColumnarWriter
+from datadog_export.errors import ExportError
+from datadog_export.logger import log
+from datadog_export.metrics import MetricsExporter
+
+
+class JobExporter(MetricsExporter):
+    """
+    exports the metrics of a single job, reporting each completed window on
+    the `progress` queue.
+    """
+
+    def __init__(
+        self,
+        account: str,
+        start_time: Optional[datetime],
+        end_time: datetime,
+        window: Duration,
+        progress,
+    ):
+        super(JobExporter, self).__init__(account, start_time, end_time, window)
+        self.progress = progress
+
+    def window_completed(self, st: datetime, et: datetime):
+        super(JobExporter, self).window_completed(st, et)
+        self.progress.put(et)
+
+
+def load(filename: str) -> dict:
+    """
+    reads the job file, in json or yaml format. yaml requires PyYAML.
+    """
+    with open(filename, "r") as file:
+        if not filename.endswith((".yaml", ".yml")):
+            return json.load(file)
+        try:
+            import yaml
+        except ImportError:
+            raise click.UsageError(
+                f"{filename} requires PyYAML, install datadog-exporter[yaml]"
+            )
+        return yaml.safe_load(file)
+
+
+def parse(definition: dict) -> List[dict]:
+    """
+    validates the jobs in the job file `definition`, and returns them with
+    their times, windows and rate limit budget parsed.
+    """
+    to_datetime = click_argument_types.DateTime()
+    to_duration = click_argument_types.Duration()
+    now = datetime.now().astimezone(pytz.UTC).replace(second=0, microsecond=0)
+    accounts = definition.get("accounts", {})
+    result = []
+    for i, job in enumerate(definition.get("jobs", [])):
+        if not job.get("queries") or not job.get("start_time") or not job.get("output"):
+            raise click.UsageError(f"job {i} requires queries, start_time and output")
+        account = job.get("account", "DEFAULT")
+        result.append(
+            {
+                "account": account,
+                "queries": job["queries"],
+                "start_time": to_datetime.convert(job["start_time"], None, None),
+                "end_time": to_datetime.convert(job.get("end_time", now), None, None),
+                "window": to_duration.convert(job.get("window", "24h"), None, None),
+                "output": job["output"],
+                "format": job.get("format", "json"),
+                "iso_datetime": job.get("iso_datetime", False),
+                "concurrency": job.get("concurrency", 1),
+                "budget": accounts.get(account, {}).get("budget", 1.0),
+            }
+        )
+    return result
+
+
+def windows(job: dict) -> int:
+    window = timedelta(seconds=job["window"].to_seconds())
+    return -(-(job["end_time"] - job["start_time"]) // window)
+
+
+def run(job: dict, progress) -> dict:
+    """
+    exports the metrics of the `job`, and returns a summary of the result.
+    """
+    started = monotonic()
+    exporter = JobExporter(
+        job["account"], job["start_time"], job["end_time"], job["window"], progress
+    )
+    exporter.queries = job["queries"]
+    exporter.format = job["format"]
+    exporter.iso_date_formats = job["iso_datetime"] and job["format"] in [
+        "json",
+        "ndjson",
+    ]
+    exporter.concurrency = job["concurrency"]
+    exporter.scheduler.budget = job["budget"]
+    summary = {"account": job["account"], "output": job["output"], "status": "ok"}
+    try:
+        with open(job["output"], "w") as output:
+            exporter.output = output
+            if job["format"] in ColumnarWriter.formats:
+                exporter.columnar_writer = ColumnarWriter(output.buffer, job["format"])
+            try:
+                exporter.connect()
+                exporter.export()
+            finally:
+                exporter.close()
+    except ExportError as e:
+        log.error(e)
+        summary["status"] = f"failed, {e}"
+    except Exception as e:
+        log.exception(e)
+        summary["status"] = f"failed, {e}"
+
+    summary.update(
+        {
+            "series": exporter.stats.counts["series"],
+            "points": exporter.stats.counts["points"],
+            "elapsed": monotonic() - started,
+            "fetching": exporter.scheduler.fetching,
+            "throttled": exporter.scheduler.throttled,
+        }
+    )
+    return summary
+
+
+@click.command(name="jobs")
+@click.option(
+    "--processes",
+    required=False,
+    default=os.cpu_count(),
+    type=click.IntRange(min=1),
+    help="number of jobs to run in parallel, default the number of cpus",
+)
+@click.argument("job_file", required=True, type=click.Path(exists=True))
+def main(processes: int, job_file: str):
+    """
+    export datadog metrics for the jobs in a json or yaml job file.
+    """
+    jobs = parse(load(job_file))
+    total = sum(windows(job) for job in jobs)
+    completed = 0
+    summaries = []
+    with Manager() as manager, ProcessPoolExecutor(max_workers=processes) as pool:
+        progress = manager.Queue()
+        pending = {pool.submit(run, job, progress) for job in jobs}
+        while pending:
+            done, pending = wait(pending, timeout=10)
+            while not progress.empty():
+                progress.get()
+                completed += 1
+            for future in done:
+                summary = future.result()
+                summaries.append(summary)
+                log.info(
+                    "{output} of {account} {status}, {series} series and {points} points in {elapsed:.1f}s".format(
+                        **summary
+                    )
+                )
+            log.info(
+                f"{len(summaries)} of {len(jobs)} jobs and {completed} of {total} windows completed"
+            )
+
+    failed = [s for s in summaries if s["status"] != "ok"]
+    log.info(
+        "{} jobs completed, {} failed. {} series and {} points, {:.1f}s fetching, {:.1f}s throttled".format(
+            len(summaries) - len(failed),
+            len(failed),
+            sum(s["series"] for s in summaries),
+            sum(s["points"] for s in summaries),
+            sum(s["fetching"] for s in summaries),
+            sum(s["throttled"] for s in summaries),
+        )
+    )
+    if failed:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,6 @@
 from datadog_export.logger import log
-from copy import deepcopy
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import click
 import pytz
@@ -9,10 +8,30 @@ import requests
 from durations import Duration
 
 from datadog_export import click_argument_types
+from datadog_export.columnar import ColumnarWriter
+from datadog_export.downsample import Downsampler
+from datadog_export.cache import ResponseCache
+from datadog_export.errors import ExportError, QueryError
 from datadog_export.exporter import Exporter
+from datadog_export.output import Output
+from datadog_export.series import Series
+from datadog_export.state import StateFile
+from datadog_export.streaming import body, members, require_ijson
 
 
 class MetricsExporter(Exporter):
+    """
+    exports the series of metric queries, window by window.
+
+    Datadog rolls up the points of a query into the smallest of the
+    `rollup_intervals` for which a window holds at most `max_points` points.
+    """
+
+    rollup_intervals = [20, 60, 300, 600, 1800, 3600, 7200, 14400, 86400]
+    rollup_methods = ["avg", "sum", "min", "max", "count"]
+    rate_limit = 1600
+    rate_limit_period = 3600
+
     def __init__(
         self,
         account: str,
@@ -21,46 +40,329 @@ class MetricsExporter(Exporter):
         window: Duration,
     ):
         super(MetricsExporter, self).__init__(account, start_time, end_time, window)
-        self.query = None
+        self.queries: List[str] = []
+        self.max_query_length = 2000
+        self.max_points = 300
+        self.columnar_writer: Optional[ColumnarWriter] = None
+        self.stitch = False
+        self.downsampler: Optional[Downsampler] = None
+        self.stitched: Dict[Tuple[str, str, str], Series] = {}
+        self.envelopes: Dict[str, dict] = {}
+        self.last_points: Dict[Tuple[str, str, str], float] = {}
+
+    @property
+    def query(self) -> Optional[str]:
+        return ",".join(self.queries) if self.queries else None
+
+    @query.setter
+    def query(self, query: Optional[str]):
+        self.queries = [query] if query else []
+
+    def batches(self) -> List[List[str]]:
+        """
+        packs the queries into batches, which are requested in a single API
+        call each, with a combined length of at most `max_query_length`.
+        """
+        result = []
+        for query in self.queries:
+            if result and len(",".join(result[-1] + [query])) <= self.max_query_length:
+                result[-1].append(query)
+            else:
+                result.append([query])
+        return result
+
+    def plan_resolution(self, resolution: Duration, rollup: Optional[str] = None):
+        """
+        sets the window to the largest window for which Datadog returns the
+        points at `resolution` or finer, and aligns the start time to the
+        resolution, so that windows do not split a rollup interval. With a
+        `rollup` method, the queries are rolled up to exactly `resolution`.
+        """
+        seconds = int(resolution.to_seconds())
+        intervals = [i for i in self.rollup_intervals if i <= seconds]
+        if not intervals:
+            raise ValueError(
+                f"the resolution must be at least {self.rollup_intervals[0]}s"
+            )
+        interval = intervals[-1]
+        if rollup:
+            self.queries = [
+                q if ".rollup(" in q else f"{q}.rollup({rollup}, {seconds})"
+                for q in self.queries
+            ]
+        else:
+            if interval != seconds:
+                log.warning(
+                    f"points are returned at {interval}s, as {seconds}s is not a rollup interval of Datadog"
+                )
+            seconds = interval
+
+        window = max(seconds, interval * self.max_points // seconds * seconds)
+        self.window = Duration(self.representation(window))
+        if self._start_time:
+            start = int(self.start_time.timestamp())
+            self.start_time = datetime.fromtimestamp(start - start % seconds, pytz.UTC)
+
+    @staticmethod
+    def representation(seconds: int) -> str:
+        for unit, size in [("d", 86400), ("h", 3600), ("m", 60)]:
+            if seconds % size == 0:
+                return f"{seconds // size}{unit}"
+        return f"{seconds}s"
+
+    def plan(self) -> str:
+        """
+        describes the API calls the export will make, and the fraction of the
+        rate limit of the query API they consume.
+        """
+        windows = sum(1 for _ in self.windows(self.resume_time()))
+        batches = len(self.batches())
+        calls = windows * batches
+        rate_limit = self.rate_limit * self.scheduler.budget
+        duration = timedelta(seconds=int(calls / rate_limit * self.rate_limit_period))
+        return "\n".join(
+            [
+                f"{windows} windows of {self.window.representation} from {self.resume_time()} to {self.end_time}",
+                f"{len(self.queries)} queries in {batches} calls per window",
+                f"{calls} API calls, {calls / rate_limit:.1%} of a rate limit of {self.rate_limit} calls per {self.rate_limit_period}s",
+                (
+                    f"at least {duration} when the calls exceed the rate limit"
+                    if calls > rate_limit
+                    else "within a single rate limit period"
+                ),
+            ]
+        )
 
     def export_started(self):
+        batches = len(self.batches())
+        requests_per_window = f" with {batches} calls per window" if batches > 1 else ""
         log.info(
-            f"exporting {self.query} from {self.start_time} to {self.end_time} in {self.window.representation} steps"
+            f"exporting {self.query} from {self.start_time} to {self.end_time} in {self.window.representation} steps{requests_per_window}"
         )
 
-    def _get(self, st: datetime, et: datetime) -> requests.Response:
-        return requests.get(
-            "https://api.datadoghq.com/api/v1/query",
-            headers=self.get_headers(),
+    def output_variables(self) -> dict:
+        result = super(MetricsExporter, self).output_variables()
+        result["query"] = self.query
+        return result
+
+    def state_key(self) -> Optional[str]:
+        return f"{self.account}:metrics:{self.query}"
+
+    def _get(
+        self, st: datetime, et: datetime, query: Optional[str] = None
+    ) -> requests.Response:
+        return self.get(
+            f"{self.api_host}/api/v1/query",
             params={
                 "from": int(st.timestamp()),
                 "to": int(et.timestamp()),
-                "query": self.query,
+                "query": query if query else self.query,
             },
+            until=et,
         )
 
+    def fetch(self, st: datetime, et: datetime) -> List[requests.Response]:
+        """
+        gets the window [st, et) with a single API call per batch of queries.
+        """
+        return [self._get(st, et, ",".join(batch)) for batch in self.batches()]
+
+    def documents(
+        self, st: datetime, et: datetime, responses: List[requests.Response]
+    ) -> Iterator[dict]:
+        """
+        yields the series of each query in the batched `responses` as a
+        separate response.
+        """
+        for batch, response in zip(self.batches(), responses):
+            if response.status_code != 200:
+                self.failed(response)
+
+            if self.streaming:
+                yield from self.stream(batch, response)
+                continue
+
+            r = response.json()
+            if r.get("status") == "error":
+                raise QueryError(r["error"])
+            for index, query in enumerate(batch):
+                yield self.demultiplex(r, index, query)
+
+    def stream(self, batch: List[str], response: requests.Response) -> Iterator[dict]:
+        """
+        parses the `response` incrementally, and yields each series as a
+        separate response as soon as it has been read.
+        """
+        envelope = {}
+        for name, value in members(body(response), "series"):
+            if name == "series.item":
+                r = dict(envelope)
+                r["query"] = batch[value.get("query_index", 0)]
+                r["series"] = [value]
+                yield r
+            elif name != "series":
+                envelope[name] = value
+
+        if envelope.get("status") == "error":
+            raise QueryError(envelope["error"])
+
+    def series(self) -> Iterator[Series]:
+        """
+        yields the series of the export lazily, window by window.
+        """
+        for document in self.iterate():
+            for series in Series.from_response(document):
+                self.stats.count("series")
+                self.stats.count("points", len(series))
+                yield series
+
+    @staticmethod
+    def demultiplex(response: dict, index: int, query: str) -> dict:
+        """
+        returns the `response` with only the series of the query at `index`.
+        """
+        result = dict(response)
+        result["query"] = query
+        result["series"] = [
+            s for s in response.get("series", []) if s.get("query_index", 0) == index
+        ]
+        return result
+
     def convert_to_timestamps(self, response):
+        """
+        converts the timestamps in the `response` to iso format, in place.
+        """
         if not self.iso_date_formats:
             return response
 
-        r = deepcopy(response)
-        if "from_date" in r:
-            r["from_date"] = self.to_datetime(r["from_date"]).isoformat()
-            r["to_date"] = self.to_datetime(r["to_date"]).isoformat()
-        for s in r["series"]:
-            s["start"] = self.to_datetime(s["start"]).isoformat()
-            s["end"] = self.to_datetime(s["end"]).isoformat()
+        to_isoformat = self.to_isoformat
+        if "from_date" in response:
+            response["from_date"] = to_isoformat(response["from_date"])
+            response["to_date"] = to_isoformat(response["to_date"])
+        for s in response["series"]:
+            s["start"] = to_isoformat(s["start"])
+            s["end"] = to_isoformat(s["end"])
             for point in s["pointlist"]:
-                point[0] = self.to_datetime(point[0]).isoformat()
-        return r
+                point[0] = to_isoformat(point[0])
+        return response
+
+    def records(self, response: dict) -> Iterator[dict]:
+        for s in response["series"]:
+            for timestamp, value in s["pointlist"]:
+                record = {
+                    "metric": s.get("metric"),
+                    "scope": s.get("scope"),
+                    "tags": s.get("tag_set", []),
+                    "timestamp": timestamp,
+                    "value": value,
+                }
+                if "rollup" in s:
+                    record["rollup"] = s["rollup"]
+                yield record
+
+    def write(self, response):
+        if self.format not in ColumnarWriter.formats:
+            super(MetricsExporter, self).write(response)
+            return
+
+        if not self.columnar_writer:
+            self.columnar_writer = ColumnarWriter(self.output.buffer, self.format)
+        self.columnar_writer.write(response)
+
+    def close(self, failed: bool = False):
+        if self.columnar_writer:
+            self.columnar_writer.close()
+        super(MetricsExporter, self).close(failed)
 
     def process(self, response):
-        if response["status"] != "error":
+        if self.follow:
+            response = self.continued(response)
+        self.stats.count("series", len(response["series"]))
+        self.stats.count("points", sum(len(s["pointlist"]) for s in response["series"]))
+        if self.downsampler:
+            response = self.downsampler.add(response)
+            if not response["series"]:
+                return
+        self.emit(response)
+
+    def continued(self, response: dict) -> dict:
+        """
+        removes the points of each series in the `response` which do not lie
+        after the last point written of that series. Consecutive windows both
+        return the point on their boundary, which would otherwise be written
+        twice when following.
+        """
+        query = response.get("query")
+        for s in response["series"]:
+            key = (query, s.get("metric"), s.get("scope"))
+            last = self.last_points.get(key)
+            if last is not None:
+                s["pointlist"] = [p for p in s["pointlist"] if p[0] > last]
+            if s["pointlist"]:
+                self.last_points[key] = s["pointlist"][-1][0]
+        return response
+
+    def emit(self, response):
+        """
+        writes the `response`, or stitches its series to the previous windows.
+        """
+        if self.stitch:
+            self.stitch_series(response)
+            return
+
+        with self.stats.stage("convert"):
             r = self.convert_to_timestamps(response)
-            self.write(r)
-        else:
-            log.error(response["error"])
-            exit(1)
+        self.write(r)
+
+    def stitch_series(self, response: dict):
+        """
+        appends the points of the series in the `response` to the series with
+        the same query, metric, scope and rollup of the previous windows. Points
+        of a window overlapping the previous window are only kept once.
+        """
+        query = response.get("query")
+        envelope = self.envelopes.get(query)
+        if envelope is None:
+            envelope = {k: v for k, v in response.items() if k != "series"}
+            self.envelopes[query] = envelope
+        elif "to_date" in response:
+            envelope["to_date"] = response["to_date"]
+
+        for s in response["series"]:
+            key = (query, s.get("metric"), s.get("scope"), s.get("rollup"))
+            series = self.stitched.get(key)
+            if series is None:
+                series = Series(s, query)
+                self.stitched[key] = series
+            elif s.get("interval") != series.interval:
+                log.warning(
+                    "interval of %s{%s} changed from %s to %s, keeping %s",
+                    series.metric,
+                    series.scope,
+                    series.interval,
+                    s.get("interval"),
+                    series.interval,
+                )
+            series.extend(s["pointlist"])
+
+    def write_stitched(self):
+        """
+        writes each stitched series as a separate response covering the
+        whole export, releasing the series once written.
+        """
+        for key in list(self.stitched):
+            series = self.stitched.pop(key)
+            r = dict(self.envelopes[key[0]])
+            r["series"] = [series.to_dict()]
+            self.write(self.convert_to_timestamps(r))
+        self.envelopes = {}
+
+    def flush(self):
+        if self.downsampler:
+            for response in self.downsampler.flush():
+                self.emit(response)
+        if self.stitch:
+            self.write_stitched()
 
 
 @click.command(name="metrics")
@@ -69,9 +371,9 @@ class MetricsExporter(Exporter):
 )
 @click.option(
     "--start-time",
-    required=True,
+    required=False,
     type=click_argument_types.DateTime(),
-    help="of the export. either a duration, date or timestamp",
+    help="of the export. either a duration, date or timestamp. required without --state-file",
 )
 @click.option(
     "--end-time",
@@ -87,6 +389,36 @@ class MetricsExporter(Exporter):
     type=click_argument_types.Duration(),
     help="size of an export window, default 24h",
 )
+@click.option(
+    "--resolution",
+    required=False,
+    type=click_argument_types.Duration(),
+    help="of the points, sets the largest --window which returns this resolution",
+)
+@click.option(
+    "--rollup",
+    required=False,
+    type=click.Choice(MetricsExporter.rollup_methods),
+    help="method to roll up the points to exactly --resolution",
+)
+@click.option(
+    "--plan/--no-plan",
+    required=False,
+    default=False,
+    help="print the windows and API calls of the export, without exporting",
+)
+@click.option(
+    "--downsample",
+    required=False,
+    type=click_argument_types.Duration(),
+    help="the points into buckets of this interval before writing",
+)
+@click.option(
+    "--aggregation",
+    required=False,
+    multiple=True,
+    help="of the downsampled buckets: avg, sum, min, max, count or a percentile like p95. default avg",
+)
 @click.option(
     "--iso-datetime/--no-iso-datetime",
     required=False,
@@ -99,26 +431,280 @@ class MetricsExporter(Exporter):
     default=False,
     help="output json in pretty print",
 )
+@click.option(
+    "--format",
+    "output_format",
+    required=False,
+    default="json",
+    type=click.Choice(["json", "ndjson"] + ColumnarWriter.formats),
+    help="of the output, a json document per window, a json line per point or columns in parquet or arrow. default json",
+)
+@click.option(
+    "--streaming/--no-streaming",
+    required=False,
+    default=False,
+    help="parse responses incrementally and write each series as soon as it is read",
+)
+@click.option(
+    "--stitch/--no-stitch",
+    required=False,
+    default=False,
+    help="write a single continuous series per metric and scope over all windows",
+)
+@click.option(
+    "--max-query-length",
+    required=False,
+    default=2000,
+    type=click.IntRange(min=1),
+    help="of the queries combined in a single API call, default 2000",
+)
+@click.option(
+    "--output",
+    required=False,
+    help="file or s3://bucket/key to write the export to, default stdout",
+)
+@click.option(
+    "--compress",
+    required=False,
+    type=click.Choice(Output.compressions),
+    help="the output with gzip or zstd",
+)
+@click.option(
+    "--rotate-size",
+    required=False,
+    default=0,
+    type=click.IntRange(min=0),
+    help="rotate the output file after a window once it exceeds this size in MB",
+)
+@click.option(
+    "--rotate-windows",
+    required=False,
+    default=0,
+    type=click.IntRange(min=0),
+    help="rotate the output file after this number of windows",
+)
+@click.option(
+    "--s3-in-flight",
+    required=False,
+    default=4,
+    type=click.IntRange(min=1),
+    help="maximum number of parts uploading concurrently to an s3:// output, default 4",
+)
+@click.option(
+    "--concurrency",
+    required=False,
+    default=1,
+    type=click.IntRange(min=1),
+    help="number of windows to fetch in parallel, default 1",
+)
+@click.option(
+    "--pool-size",
+    required=False,
+    default=10,
+    type=click.IntRange(min=1),
+    help="maximum number of connections kept alive, default 10",
+)
+@click.option(
+    "--timeout",
+    required=False,
+    default=60.0,
+    type=click.FloatRange(min=0, min_open=True),
+    help="of an API call in seconds, default 60",
+)
+@click.option(
+    "--max-retries",
+    required=False,
+    default=5,
+    type=click.IntRange(min=0),
+    help="of an API call failing with a 5xx, connection error or timeout, default 5",
+)
+@click.option(
+    "--retry-budget",
+    required=False,
+    default=100,
+    type=click.IntRange(min=0),
+    help="maximum number of retries of the export, default 100",
+)
+@click.option(
+    "--cache-dir",
+    required=False,
+    type=click.Path(file_okay=False),
+    help="to cache the responses of windows in the past, default no cache",
+)
+@click.option(
+    "--cache-size",
+    required=False,
+    default=1024,
+    type=click.IntRange(min=1),
+    help="maximum size of the response cache in MB, default 1024",
+)
+@click.option(
+    "--state-file",
+    required=False,
+    type=click.Path(dir_okay=False),
+    help="to record the last exported window in, and resume from",
+)
+@click.option(
+    "--follow/--no-follow",
+    required=False,
+    default=False,
+    help="keep exporting new windows as soon as they are closed",
+)
+@click.option(
+    "--lag",
+    required=False,
+    default=Duration("1m"),
+    type=click_argument_types.Duration(),
+    help="to wait for late data before a closed window is exported in follow mode, default 1m",
+)
+@click.option(
+    "--stats-file",
+    required=False,
+    type=click.Path(dir_okay=False),
+    help="to write the statistics of the export to, in the Prometheus textfile format if it ends with .prom, otherwise json",
+)
+@click.option(
+    "--profile",
+    required=False,
+    type=click.Path(dir_okay=False),
+    help="file to write a cProfile profile of the export to",
+)
+@click.option(
+    "--trace-memory/--no-trace-memory",
+    required=False,
+    default=False,
+    help="trace the peak memory and largest allocations with tracemalloc",
+)
 @click.argument("query", required=True, nargs=-1)
 def main(
     account: str,
     start_time: datetime,
     end_time: datetime,
     window: Duration,
+    resolution: Optional[Duration],
+    rollup: Optional[str],
+    plan: bool,
+    downsample: Optional[Duration],
+    aggregation: List[str],
     iso_datetime: bool,
     pretty_print: bool,
+    output_format: str,
+    streaming: bool,
+    stitch: bool,
+    max_query_length: int,
+    output: Optional[str],
+    compress: Optional[str],
+    rotate_size: int,
+    rotate_windows: int,
+    s3_in_flight: int,
+    concurrency: int,
+    pool_size: int,
+    timeout: float,
+    max_retries: int,
+    retry_budget: int,
+    cache_dir: Optional[str],
+    cache_size: int,
+    state_file: Optional[str],
+    follow: bool,
+    lag: Duration,
+    stats_file: Optional[str],
+    profile: Optional[str],
+    trace_memory: bool,
     query,
 ):
     """
     export datadog metrics.
     """
+    if not start_time and not state_file:
+        raise click.UsageError(
+            "Missing option '--start-time', required without --state-file."
+        )
+    if output_format in ColumnarWriter.formats and streaming:
+        raise click.UsageError(f"the {output_format} format cannot be streamed.")
+    if output_format in ColumnarWriter.formats and (rotate_size or rotate_windows):
+        raise click.UsageError(f"the {output_format} format cannot be rotated.")
+    if output_format in ColumnarWriter.formats and state_file:
+        raise click.UsageError(
+            f"the {output_format} format cannot be appended to, so it cannot be resumed with --state-file."
+        )
+    if stitch and (state_file or follow or rotate_size or rotate_windows):
+        raise click.UsageError(
+            "--stitch cannot be combined with --state-file, --follow or rotation."
+        )
+
     exporter = MetricsExporter(account, start_time, end_time, window)
     exporter.iso_date_formats = iso_datetime
     exporter.pretty_print = pretty_print
-    exporter.connect()
-    for q in query:
-        exporter.query = q
+    exporter.format = output_format
+    exporter.streaming = streaming
+    exporter.stitch = stitch
+    exporter.concurrency = concurrency
+    exporter.pool_size = pool_size
+    exporter.timeout = timeout
+    exporter.retry.max_retries = max_retries
+    exporter.retry.budget = retry_budget
+    if cache_dir:
+        exporter.cache = ResponseCache(cache_dir, cache_size * 1024 * 1024)
+    if state_file:
+        exporter.state = StateFile(state_file)
+    exporter.follow = follow
+    exporter.lag = lag
+    exporter.stats_file = stats_file
+    exporter.profile = profile
+    exporter.trace_memory = trace_memory
+    exporter.queries = list(query)
+    exporter.max_query_length = max_query_length
+    if rollup and not resolution:
+        raise click.UsageError("--rollup requires a --resolution.")
+    if resolution:
+        try:
+            exporter.plan_resolution(resolution, rollup)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+    if plan:
+        click.echo(exporter.plan())
+        return
+    if aggregation and not downsample:
+        raise click.UsageError("--aggregation requires --downsample.")
+    if downsample and state_file:
+        raise click.UsageError("--downsample cannot be combined with --state-file.")
+    if downsample:
+        if output_format in ColumnarWriter.formats and len(aggregation) > 1:
+            raise click.UsageError(
+                f"the {output_format} format supports a single --aggregation."
+            )
+        try:
+            exporter.downsampler = Downsampler(
+                int(downsample.to_seconds()), list(aggregation) or ["avg"]
+            )
+        except ValueError as e:
+            raise click.UsageError(str(e))
+
+    try:
+        exporter.open_output(
+            output, compress, rotate_size * 1024 * 1024, rotate_windows, s3_in_flight
+        )
+        if streaming:
+            require_ijson()
+        if output_format in ColumnarWriter.formats:
+            exporter.iso_date_formats = False
+            exporter.columnar_writer = ColumnarWriter(
+                exporter.output.buffer, output_format
+            )
+    except (ImportError, ValueError) as e:
+        log.error(e)
+        exit(1)
+
+    completed = False
+    try:
+        exporter.connect()
         exporter.export()
+        completed = True
+    except ExportError as e:
+        log.error(e)
+        exit(1)
+    finally:
+        exporter.close(failed=not completed)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,365 @@
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, sleep
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import click
+
+from datadog_export.logger import log
+
+
+def split_queries(query: str) -> List[str]:
+    """
+    splits the comma separated `query` into its queries, ignoring the commas
+    within braces and parentheses.
+    """
+    result = [""]
+    depth = 0
+    for c in query:
+        if c in "{(":
+            depth += 1
+        elif c in "})":
+            depth -= 1
+        if c == "," and depth == 0:
+            result.append("")
+        else:
+            result[-1] += c
+    return result
+
+
+class MockAPI(object):
+    """
+    a local stand-in for the Datadog query, events and metrics API, serving
+    synthetic data on http://127.0.0.1:`port`.
+
+    Each query returns `series` series with a point per `interval` seconds,
+    the events API returns `events_per_hour` events and the metrics API
+    `metrics` names. Like Datadog, the events API returns at most the
+    `max_events` most recent events. With an `aggregate_period`, the events
+    in each period of that many seconds are returned as a single aggregated
+    event, with the events of the requested window as its children.
+    Every call takes at least `latency` seconds. With a
+    `rate_limit`, the X-RateLimit headers are returned and calls beyond the
+    limit in a `rate_limit_period` are answered with 429. A fraction of the
+    calls fails with a 429 or a 5xx, as set by `throttle_rate` and `error_rate`.
+    """
+
+    def __init__(
+        self,
+        port: int = 0,
+        series: int = 10,
+        interval: int = 20,
+        events_per_hour: int = 60,
+        max_events: int = 1000,
+        aggregate_period: int = 0,
+        metrics: int = 100,
+        latency: float = 0.0,
+        rate_limit: int = 0,
+        rate_limit_period: int = 10,
+        throttle_rate: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.series = series
+        self.interval = interval
+        self.events_per_hour = events_per_hour
+        self.max_events = max_events
+        self.aggregate_period = aggregate_period
+        self.metrics = metrics
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_limit_period = rate_limit_period
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.period_start = monotonic()
+        self.period_calls = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.server.api = self
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> "MockAPI":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "MockAPI":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def admit(self) -> Tuple[int, dict]:
+        """
+        counts the call against the rate limit, and returns the status code
+        to inject, or 200, with the rate limit headers.
+        """
+        with self.lock:
+            self.requests += 1
+            now = monotonic()
+            if now - self.period_start >= self.rate_limit_period:
+                self.period_start = now
+                self.period_calls = 0
+            self.period_calls += 1
+
+            headers = {}
+            if self.rate_limit:
+                reset = self.rate_limit_period - int(now - self.period_start)
+                headers = {
+                    "X-RateLimit-Limit": str(self.rate_limit),
+                    "X-RateLimit-Period": str(self.rate_limit_period),
+                    "X-RateLimit-Remaining": str(
+                        max(0, self.rate_limit - self.period_calls)
+                    ),
+                    "X-RateLimit-Reset": str(max(1, reset)),
+                }
+
+            if self.rate_limit and self.period_calls > self.rate_limit:
+                status = 429
+            elif self.random.random() < self.throttle_rate:
+                status = 429
+            elif self.random.random() < self.error_rate:
+                status = self.random.choice([500, 502, 503, 504])
+            else:
+                status = 200
+
+            if status == 429:
+                self.throttled += 1
+            elif status != 200:
+                self.errors += 1
+            return status, headers
+
+    def query(self, params: dict) -> dict:
+        start = int(params["from"][0])
+        end = int(params["to"][0])
+        query = params["query"][0]
+        first = -(-start // self.interval) * self.interval
+        timestamps = list(range(first, end + 1, self.interval))
+        series = []
+        for index, q in enumerate(split_queries(query)):
+            metric = q.split("{")[0].split(":")[-1].strip("() ")
+            for n in range(self.series):
+                pointlist = [
+                    [t * 1000.0, float(n + (t // self.interval) % 100)]
+                    for t in timestamps
+                ]
+                series.append(
+                    {
+                        "metric": metric,
+                        "display_name": metric,
+                        "unit": None,
+                        "aggr": "avg",
+                        "scope": f"host:host-{n}",
+                        "tag_set": [f"host:host-{n}"],
+                        "expression": f"avg:{metric}{{host:host-{n}}}",
+                        "query_index": index,
+                        "interval": self.interval,
+                        "length": len(pointlist),
+                        "start": pointlist[0][0] if pointlist else start * 1000,
+                        "end": pointlist[-1][0] if pointlist else end * 1000,
+                        "pointlist": pointlist,
+                        "attributes": {},
+                    }
+                )
+        return {
+            "status": "ok",
+            "res_type": "time_series",
+            "resp_version": 1,
+            "query": query,
+            "from_date": start * 1000,
+            "to_date": end * 1000,
+            "group_by": ["host"],
+            "series": series,
+        }
+
+    def events(self, params: dict) -> dict:
+        start = int(params["start"][0])
+        end = int(params["end"][0])
+        step = max(1, int(3600 / self.events_per_hour)) if self.events_per_hour else 0
+        events = []
+        if step:
+            for t in range(-(-start // step) * step, end, step):
+                events.append(
+                    {
+                        "id": t,
+                        "title": f"synthetic event {t}",
+                        "text": "a synthetic event",
+                        "date_happened": t,
+                        "source_type_name": "synthetic",
+                        "priority": "normal",
+                        "alert_type": "info",
+                        "tags": ["env:benchmark"],
+                        "is_aggregate": False,
+                        "children": [],
+                        "url": f"/event/event?id={t}",
+                    }
+                )
+        if self.aggregate_period:
+            events = self.aggregate(events)
+        return {"status": "ok", "events": list(reversed(events))[: self.max_events]}
+
+    def aggregate(self, events: List[dict]) -> List[dict]:
+        """
+        returns the `events` as an aggregated event per `aggregate_period`.
+        """
+        result = {}
+        for event in events:
+            period = event["date_happened"] // self.aggregate_period
+            if period not in result:
+                result[period] = dict(
+                    event,
+                    id=10**9 + period,
+                    title=f"synthetic aggregate {period}",
+                    is_aggregate=True,
+                    children=[],
+                )
+            result[period]["date_happened"] = event["date_happened"]
+            result[period]["children"].append(
+                {"id": event["id"], "date_happened": event["date_happened"]}
+            )
+        for event in result.values():
+            event["children"].reverse()
+        return list(result.values())
+
+    def metric_names(self, params: dict) -> dict:
+        return {
+            "metrics": [f"synthetic.metric.{i}" for i in range(self.metrics)],
+            "from": params.get("from", ["0"])[0],
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # the headers and body are sent in separate writes, which would otherwise
+    # wait for the delayed ack of the client.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        api: MockAPI = self.server.api
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if api.latency:
+            sleep(api.latency)
+
+        status, headers = api.admit()
+        if status != 200:
+            body = {"errors": [f"injected {status}"]}
+        elif url.path == "/api/v1/query":
+            body = api.query(params)
+        elif url.path == "/api/v1/events":
+            body = api.events(params)
+        elif url.path == "/api/v1/metrics":
+            body = api.metric_names(params)
+        else:
+            status, body = 404, {"errors": ["Not Found"]}
+
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+@click.command(name="mock-api")
+@click.option("--port", required=False, default=8080, type=int, help="default 8080")
+@click.option(
+    "--series", required=False, default=10, type=int, help="per query, default 10"
+)
+@click.option(
+    "--interval",
+    required=False,
+    default=20,
+    type=int,
+    help="between points in seconds, default 20",
+)
+@click.option(
+    "--events-per-hour", required=False, default=60, type=int, help="default 60"
+)
+@click.option(
+    "--max-events",
+    required=False,
+    default=1000,
+    type=int,
+    help="returned per call, default 1000",
+)
+@click.option(
+    "--aggregate-period",
+    required=False,
+    default=0,
+    type=int,
+    help="in seconds of the aggregated events, default none",
+)
+@click.option(
+    "--metrics", required=False, default=100, type=int, help="names, default 100"
+)
+@click.option(
+    "--latency",
+    required=False,
+    default=0.0,
+    type=float,
+    help="of each call in seconds, default 0",
+)
+@click.option(
+    "--rate-limit",
+    required=False,
+    default=0,
+    type=int,
+    help="calls per period, default unlimited",
+)
+@click.option(
+    "--rate-limit-period",
+    required=False,
+    default=10,
+    type=int,
+    help="in seconds, default 10",
+)
+@click.option(
+    "--throttle-rate",
+    required=False,
+    default=0.0,
+    type=float,
+    help="fraction of calls answered with 429, default 0",
+)
+@click.option(
+    "--error-rate",
+    required=False,
+    default=0.0,
+    type=float,
+    help="fraction of calls answered with a 5xx, default 0",
+)
+def main(port: int, **kwargs):
+    """
+    serve a local stand-in for the Datadog API with synthetic data.
+    """
+    api = MockAPI(port, **kwargs)
+    log.info(f"serving the mock Datadog API on {api.url}")
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 from datetime import datetime
 import requests
 from durations import Duration
-from typing import Optional, List
+from typing import Iterator, Optional, List
 import pytz
 from re import Pattern
+from datadog_export.errors import ExportError
 from datadog_export.exporter import Exporter
 from datadog_export.logger import log
 import click
@@ -18,7 +19,7 @@ class MetricNamesExporter(Exporter):
         window = Duration("{}s".format((end_time - start_time).total_seconds() + 1))
         super(MetricNamesExporter, self).__init__(account, start_time, end_time, window)
         self.hosts = []
-        self.metrics = []
+        self.pattern: Optional[Pattern] = None
 
     def export_started(self):
         log.info(f"exporting metric names from {self.start_time}")
@@ -28,14 +29,29 @@ class MetricNamesExporter(Exporter):
         if self.hosts:
             params["hosts"] = self.hosts
 
-        return requests.get(
-            "https://api.datadoghq.com/api/v1/metrics",
-            headers=self.get_headers(),
+        return self.get(
+            f"{self.api_host}/api/v1/metrics",
             params=params,
         )
 
+    def matching(self, response: dict) -> Iterator[str]:
+        """
+        yields the metric names in the `response` which match the pattern.
+        """
+        for name in response["metrics"]:
+            if self.pattern is None or self.pattern.fullmatch(name):
+                yield name
+
+    def names(self) -> Iterator[str]:
+        """
+        yields the matching metric names lazily.
+        """
+        for document in self.iterate():
+            yield from self.matching(document)
+
     def process(self, response: dict):
-        self.metrics.extend(response["metrics"])
+        for name in self.matching(response):
+            self.output.write(f"{name}\n")
 
 
 @click.command(name="names")
@@ -56,18 +72,54 @@ class MetricNamesExporter(Exporter):
     type=click_argument_types.RegEx(),
     help="regular expression of metrics to list, default .*",
 )
+@click.option(
+    "--concurrency",
+    required=False,
+    default=1,
+    type=click.IntRange(min=1),
+    help="number of windows to fetch in parallel, default 1",
+)
+@click.option(
+    "--pool-size",
+    required=False,
+    default=10,
+    type=click.IntRange(min=1),
+    help="maximum number of connections kept alive, default 10",
+)
+@click.option(
+    "--timeout",
+    required=False,
+    default=60.0,
+    type=click.FloatRange(min=0, min_open=True),
+    help="of an API call in seconds, default 60",
+)
 @click.option("--host", required=False, multiple=True, help="to obtain metrics from")
-def main(account: str, start_time: datetime, pattern: Pattern, host: List[str]):
+def main(
+    account: str,
+    start_time: datetime,
+    pattern: Pattern,
+    concurrency: int,
+    pool_size: int,
+    timeout: float,
+    host: List[str],
+):
     """
     export datadog metric names.
     """
 
     exporter = MetricNamesExporter(account, start_time)
     exporter.hosts = host
-    exporter.connect()
-    exporter.export()
-    for metric in filter(lambda m: pattern.fullmatch(m), exporter.metrics):
-        print(metric)
+    exporter.concurrency = concurrency
+    exporter.pool_size = pool_size
+    exporter.timeout = timeout
+    exporter.pattern = pattern
+    try:
+        exporter.connect()
+        for name in exporter.names():
+            print(name)
+    except ExportError as e:
+        log.error(e)
+        exit(1)
 
 
 if __name__ == "__main__":
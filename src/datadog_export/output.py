@@ -0,0 +1,214 @@
+import gzip
+import io
+import sys
+import threading
+from datetime import datetime
+from os import path
+from queue import Queue
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from datadog_export.logger import log
+from datadog_export.s3 import S3Writer, parse_url
+
+
+class Output(io.RawIOBase):
+    """
+    writes the output on a background thread to stdout, a file or an
+    s3://bucket/key url, optionally compressed with gzip or zstd. Chunks are
+    passed to the thread through a bounded queue, so a slow disk or pipe only
+    stalls the export when `queue_size` chunks are waiting to be written.
+
+    The output is rotated into numbered shards at the start of a window, once
+    a shard contains `max_size` uncompressed bytes or `max_windows` windows.
+    The filename may refer to the `variables`, the `{start}` of the first
+    window in the shard and the `{shard}` number.
+
+    When the export fails, the output is aborted before it is closed. The
+    current S3 upload is then discarded instead of completed, while files are
+    closed with the output written so far. As S3 objects cannot be appended
+    to, resuming an export requires `{start}` in an s3:// filename.
+    """
+
+    compressions = ["gzip", "zstd"]
+    extensions = {"gzip": ".gz", "zstd": ".zst"}
+
+    def __init__(
+        self,
+        filename: Optional[str] = None,
+        compress: Optional[str] = None,
+        max_size: int = 0,
+        max_windows: int = 0,
+        append: bool = False,
+        queue_size: int = 16,
+        variables: Optional[dict] = None,
+        max_in_flight: int = 4,
+    ):
+        super(Output, self).__init__()
+        if compress == "zstd" and zstandard is None:
+            raise ImportError(
+                "zstd compression requires zstandard, install datadog-exporter[zstd]"
+            )
+        if (max_size or max_windows) and not filename:
+            raise ValueError("rotating the output requires an output file")
+        if append and filename and filename.startswith("s3://"):
+            if "{start}" not in filename:
+                raise ValueError(
+                    "resuming an export to s3 requires {start} in the output name"
+                )
+
+        self.filename = filename
+        self.compress = compress
+        self.max_size = max_size
+        self.max_windows = max_windows
+        self.append = append
+        self.variables = variables if variables else {}
+        self.max_in_flight = max_in_flight
+        self.s3_client = None
+        self.shard = 0
+        self.size = 0
+        self.windows = 0
+        self.start: Optional[datetime] = None
+        self.file = None
+        self.files = []
+        self.error: Optional[Exception] = None
+        self.aborted = False
+        self.queue = Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        if self.error:
+            raise self.error
+        self.queue.put(bytes(b))
+        return len(b)
+
+    def rotate(self, start: datetime):
+        """
+        marks the start of the window at `start`, at which the output may be rotated.
+        """
+        self.queue.put(start)
+
+    def abort(self):
+        """
+        marks the output as failed, so that the current shard is discarded
+        instead of completed on close.
+        """
+        self.aborted = True
+
+    def close(self):
+        if not self.closed:
+            self.queue.put(None)
+            self.thread.join()
+            super(Output, self).close()
+            if self.error:
+                raise self.error
+
+    def shard_filename(self) -> str:
+        filename = self.filename
+        if "{" in filename:
+            filename = filename.format(
+                start=self.start.strftime("%Y%m%dT%H%M%SZ") if self.start else "",
+                shard=self.shard,
+                **self.variables,
+            )
+        elif self.max_size or self.max_windows:
+            base, extension = path.splitext(filename)
+            filename = f"{base}-{self.shard:05d}{extension}"
+        if self.compress and not filename.endswith(self.extensions[self.compress]):
+            filename = filename + self.extensions[self.compress]
+        return filename
+
+    def open(self):
+        if not self.filename:
+            file = sys.stdout.buffer
+            self.files = []
+        elif self.filename.startswith("s3://"):
+            if not self.s3_client:
+                import boto3
+
+                self.s3_client = boto3.client("s3")
+            bucket, key = parse_url(self.shard_filename())
+            file = S3Writer(
+                self.s3_client, bucket, key, max_in_flight=self.max_in_flight
+            )
+            self.files = [file]
+        else:
+            filename = self.shard_filename()
+            log.debug(f"writing output to {filename}")
+            file = open(filename, "ab" if self.append else "wb")
+            self.files = [file]
+
+        if self.compress == "gzip":
+            file = gzip.GzipFile(fileobj=file, mode="wb")
+            self.files.insert(0, file)
+        elif self.compress == "zstd":
+            file = zstandard.ZstdCompressor().stream_writer(file, closefd=False)
+            self.files.insert(0, file)
+        self.file = file
+        self.size = 0
+        self.windows = 1
+
+    def close_file(self):
+        if self.file:
+            self.file = None
+            for file in self.files:
+                file.close()
+            if not self.filename:
+                sys.stdout.buffer.flush()
+
+    def abort_file(self):
+        if self.file:
+            self.file = None
+            if isinstance(self.files[-1], S3Writer):
+                self.files[-1].abort()
+                return
+            for file in self.files:
+                file.close()
+
+    def run(self):
+        while True:
+            chunk = self.queue.get()
+            if self.error:
+                if chunk is None:
+                    return
+                continue
+
+            try:
+                if chunk is None:
+                    if self.aborted:
+                        self.abort_file()
+                    else:
+                        self.close_file()
+                    return
+                elif isinstance(chunk, datetime):
+                    if self.file and (
+                        (self.max_size and self.size >= self.max_size)
+                        or (self.max_windows and self.windows >= self.max_windows)
+                    ):
+                        self.close_file()
+                        self.shard += 1
+                    if not self.file:
+                        self.start = chunk
+                    else:
+                        self.windows += 1
+                else:
+                    if not self.file:
+                        self.open()
+                    self.file.write(chunk)
+                    self.size += len(chunk)
+            except Exception as e:
+                self.error = e
+                try:
+                    self.abort_file()
+                except Exception:
+                    pass
+                if chunk is None:
+                    return
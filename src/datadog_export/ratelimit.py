@@ -0,0 +1,106 @@
+import threading
+from copy import copy
+from time import monotonic, sleep
+
+from datadog_export.logger import log
+
+
+class RateLimit(object):
+    def __init__(self, headers: dict):
+        self.limit = int(headers.get("X-RateLimit-Limit", "0"))
+        self.remaining = int(headers.get("X-RateLimit-Remaining", "0"))
+        self.period = int(headers.get("X-RateLimit-Period", "0"))
+        self.reset = int(headers.get("X-RateLimit-Reset", "0"))
+
+    def __str__(self):
+        if self.limit:
+            return "rate limit of {limit} API calls per {period}s. {remaining} remaining, reset in {reset}s".format(
+                **self.__dict__
+            )
+        else:
+            return ""
+
+
+class RateLimitScheduler(object):
+    """
+    paces API calls so that the remaining number of calls in the rate limit
+    period never reaches zero. Once the remaining calls drop below the
+    `low_water_mark` fraction of the limit, the calls are spread evenly over
+    the rest of the period. When only `reserve` calls remain, or the rate
+    limit is exceeded, all calls wait for the reset. With a `budget` below 1,
+    only that fraction of the limit is consumed, leaving the rest of the
+    calls to other users of the organization.
+
+    A single scheduler may be shared by concurrent workers and exporters
+    calling the same endpoint.
+    """
+
+    def __init__(
+        self, reserve: int = 1, low_water_mark: float = 0.1, budget: float = 1.0
+    ):
+        self.reserve = reserve
+        self.low_water_mark = low_water_mark
+        self.budget = budget
+        self.ratelimit = RateLimit({})
+        self.reset_at = 0.0
+        self.not_before = 0.0
+        self.fetching = 0.0
+        self.throttled = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        waits until the next API call may be made.
+        """
+        with self.lock:
+            now = monotonic()
+            start = max(now, self.not_before)
+            interval = 0.0
+            ratelimit = self.ratelimit
+            if ratelimit.limit and start < self.reset_at:
+                reserve = max(self.reserve, int(ratelimit.limit * (1 - self.budget)))
+                available = ratelimit.remaining - reserve
+                if available <= 0:
+                    start = self.reset_at
+                    self.reset_at += ratelimit.period
+                    ratelimit.remaining = ratelimit.limit
+                elif available <= ratelimit.limit * self.budget * self.low_water_mark:
+                    interval = (self.reset_at - start) / available
+                ratelimit.remaining -= 1
+            self.not_before = start + interval
+            delay = start - now
+
+        if delay > 0:
+            log.debug("throttling API call for %.1fs", delay)
+            sleep(delay)
+            with self.lock:
+                self.throttled += delay
+
+    def update(self, ratelimit: RateLimit, elapsed: float):
+        """
+        registers the `ratelimit` returned by an API call which took `elapsed` seconds.
+        """
+        with self.lock:
+            self.fetching += elapsed
+            if ratelimit.limit:
+                self.ratelimit = copy(ratelimit)
+                self.reset_at = monotonic() + ratelimit.reset
+
+    def exceeded(self, ratelimit: RateLimit):
+        """
+        holds all API calls until the exceeded `ratelimit` is reset.
+        """
+        with self.lock:
+            self.reset_at = monotonic() + max(ratelimit.reset, 1)
+            self.not_before = max(self.not_before, self.reset_at)
+            self.ratelimit.remaining = 0
+
+    def hold(self, seconds: float):
+        """
+        holds all API calls for `seconds`.
+        """
+        with self.lock:
+            self.not_before = max(self.not_before, monotonic() + seconds)
+
+    def __str__(self):
+        return f"{self.fetching:.1f}s fetching, {self.throttled:.1f}s throttled"
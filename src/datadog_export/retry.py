@@ -0,0 +1,89 @@
+import random
+import threading
+from collections import deque
+from typing import Optional
+
+import requests
+
+
+class RetryPolicy(object):
+    """
+    decides which failed API calls are retried. A call failing with a
+    transient error, a 5xx status code, a connection error or a timeout, is
+    retried with an exponential backoff with full jitter. A call is retried at
+    most `max_retries` times, and the export at most `budget` times.
+
+    When at least `error_rate` of the last `sample` calls failed, the circuit
+    breaker opens, and the calls of all workers are held for `cooldown` seconds.
+
+    A single policy may be shared by concurrent workers.
+    """
+
+    transient_status_codes = {500, 502, 503, 504}
+    transient_errors = (
+        requests.ConnectionError,
+        requests.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+    )
+
+    def __init__(
+        self,
+        max_retries: int = 5,
+        budget: int = 100,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        sample: int = 20,
+        error_rate: float = 0.5,
+        cooldown: float = 30.0,
+    ):
+        self.max_retries = max_retries
+        self.budget = budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.retries = 0
+        self.outcomes = deque(maxlen=sample)
+        self.lock = threading.Lock()
+
+    def transient(
+        self,
+        response: Optional[requests.Response] = None,
+        error: Optional[Exception] = None,
+    ) -> bool:
+        """
+        returns True if the `response` or `error` of a call is transient.
+        """
+        if error is not None:
+            return isinstance(error, self.transient_errors) and not isinstance(
+                error, requests.exceptions.SSLError
+            )
+        return response.status_code in self.transient_status_codes
+
+    def record(self, failed: bool) -> bool:
+        """
+        registers the outcome of a call, and returns True if the circuit
+        breaker opens.
+        """
+        with self.lock:
+            self.outcomes.append(failed)
+            if len(self.outcomes) == self.outcomes.maxlen and sum(
+                self.outcomes
+            ) >= self.error_rate * len(self.outcomes):
+                self.outcomes.clear()
+                return True
+            return False
+
+    def allow(self, attempt: int) -> bool:
+        """
+        returns True if a call which failed `attempt` times before may be
+        retried, and charges the retry to the budget.
+        """
+        with self.lock:
+            if attempt >= self.max_retries or self.retries >= self.budget:
+                return False
+            self.retries += 1
+            return True
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
@@ -0,0 +1,128 @@
+import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+from urllib.parse import urlparse
+
+from datadog_export.logger import log
+
+
+def parse_url(url: str) -> Tuple[str, str]:
+    """
+    returns the bucket and key of the s3://bucket/key `url`.
+    """
+    parsed = urlparse(url)
+    return parsed.netloc, parsed.path.lstrip("/")
+
+
+class S3Writer(io.RawIOBase):
+    """
+    uploads the written bytes to s3://`bucket`/`key` as a multipart upload.
+    A part is uploaded as soon as `part_size` bytes are written, with at most
+    `max_in_flight` parts uploading concurrently. An object smaller than a
+    single part is uploaded with a single put on close. When the export
+    fails, `abort` discards the upload, so no partial object is published.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        key: str,
+        part_size: int = 8 * 1024 * 1024,
+        max_in_flight: int = 4,
+    ):
+        super(S3Writer, self).__init__()
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.max_in_flight = max_in_flight
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.pending = deque()
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        if self.closed:
+            raise ValueError(f"write to closed s3://{self.bucket}/{self.key}")
+        self.buffer.extend(b)
+        while len(self.buffer) >= self.part_size:
+            self.upload_part(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+        return len(b)
+
+    def upload_part(self, data: bytes):
+        if not self.upload_id:
+            log.debug(f"starting upload to s3://{self.bucket}/{self.key}")
+            response = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key
+            )
+            self.upload_id = response["UploadId"]
+
+        if len(self.pending) >= self.max_in_flight:
+            self.parts.append(self.pending.popleft().result())
+
+        number = len(self.parts) + len(self.pending) + 1
+        self.pending.append(self.executor.submit(self._upload_part, number, data))
+
+    def _upload_part(self, number: int, data: bytes) -> dict:
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=number,
+            Body=data,
+        )
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if not self.upload_id:
+                self.client.put_object(
+                    Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer)
+                )
+            else:
+                if self.buffer:
+                    self.upload_part(bytes(self.buffer))
+                while self.pending:
+                    self.parts.append(self.pending.popleft().result())
+                self.client.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    MultipartUpload={"Parts": self.parts},
+                )
+            log.debug(f"uploaded s3://{self.bucket}/{self.key}")
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self.buffer = bytearray()
+            self.executor.shutdown()
+            super(S3Writer, self).close()
+
+    def abort(self):
+        """
+        discards the upload, without publishing the object.
+        """
+        if self.closed:
+            return
+        try:
+            while self.pending:
+                self.pending.popleft().cancel()
+            self.executor.shutdown()
+            if self.upload_id:
+                self.client.abort_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+                )
+            log.warning(f"upload to s3://{self.bucket}/{self.key} aborted")
+        finally:
+            self.buffer = bytearray()
+            super(S3Writer, self).close()
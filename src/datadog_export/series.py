@@ -0,0 +1,126 @@
+from array import array
+from math import isnan
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+class Series(object):
+    """
+    a metric series with the timestamps and values of its points stored in
+    compact arrays of doubles, at 16 bytes per point. Missing values are
+    stored as NaN. The timestamps are in milliseconds since the epoch, as
+    returned by the Datadog query API.
+
+    The arrays can be viewed as NumPy arrays and a pandas Series without
+    copying the values, which requires `pip install datadog-exporter[pandas]`.
+    """
+
+    __slots__ = (
+        "metric",
+        "scope",
+        "tag_set",
+        "interval",
+        "query",
+        "attributes",
+        "timestamps",
+        "values",
+    )
+
+    def __init__(self, attributes: Optional[dict] = None, query: Optional[str] = None):
+        attributes = dict(attributes) if attributes else {}
+        for name in ("pointlist", "start", "end", "length"):
+            attributes.pop(name, None)
+        self.metric: Optional[str] = attributes.pop("metric", None)
+        self.scope: Optional[str] = attributes.pop("scope", None)
+        self.tag_set: List[str] = attributes.pop("tag_set", [])
+        self.interval: Optional[int] = attributes.pop("interval", None)
+        self.query = query
+        self.attributes = attributes
+        self.timestamps = array("d")
+        self.values = array("d")
+
+    @classmethod
+    def from_dict(cls, series: dict, query: Optional[str] = None) -> "Series":
+        """
+        returns the `series` of a Datadog query API response as a Series.
+        """
+        result = cls(series, query)
+        result.extend(series.get("pointlist", []))
+        return result
+
+    @classmethod
+    def from_response(cls, response: dict) -> Iterator["Series"]:
+        """
+        yields the series of a Datadog query API `response`.
+        """
+        for s in response.get("series", []):
+            yield cls.from_dict(s, response.get("query"))
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __repr__(self) -> str:
+        return f"Series({self.metric}{{{self.scope}}}, {len(self)} points)"
+
+    def extend(self, pointlist: Iterable[List[Optional[float]]]):
+        """
+        appends the points of the `pointlist` which lie after the last point
+        of the series, so overlapping points are only added once.
+        """
+        last = self.timestamps[-1] if self.timestamps else None
+        for timestamp, value in pointlist:
+            if last is None or timestamp > last:
+                self.timestamps.append(timestamp)
+                self.values.append(float("nan") if value is None else value)
+                last = timestamp
+
+    def pointlist(self) -> Iterator[List[Optional[float]]]:
+        for timestamp, value in zip(self.timestamps, self.values):
+            yield [timestamp, None if isnan(value) else value]
+
+    def to_dict(self) -> dict:
+        """
+        returns the series in the format of the Datadog query API.
+        """
+        result = {"metric": self.metric, "scope": self.scope, "tag_set": self.tag_set}
+        result.update(self.attributes)
+        result["interval"] = self.interval
+        result["start"] = self.timestamps[0] if self.timestamps else None
+        result["end"] = self.timestamps[-1] if self.timestamps else None
+        result["length"] = len(self.timestamps)
+        result["pointlist"] = list(self.pointlist())
+        return result
+
+    def to_numpy(self) -> Tuple["numpy.ndarray", "numpy.ndarray"]:
+        """
+        returns the timestamps and values as NumPy arrays sharing the memory
+        of the series. The series must not be extended while they are in use.
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError(
+                "to_numpy requires numpy, install datadog-exporter[numpy]"
+            )
+        return (
+            numpy.frombuffer(self.timestamps, dtype=numpy.float64),
+            numpy.frombuffer(self.values, dtype=numpy.float64),
+        )
+
+    def to_pandas(self) -> "pandas.Series":
+        """
+        returns the values as a pandas Series indexed by the UTC timestamps.
+        The values share the memory of the series, the index is converted.
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError(
+                "to_pandas requires pandas, install datadog-exporter[pandas]"
+            )
+        timestamps, values = self.to_numpy()
+        return pandas.Series(
+            values,
+            index=pandas.to_datetime(timestamps.astype("int64"), unit="ms", utc=True),
+            name=f"{self.metric}{{{self.scope}}}",
+            copy=False,
+        )
@@ -0,0 +1,35 @@
+import json
+import os
+from datetime import datetime
+from os import path
+from typing import Optional
+
+from dateutil.parser import isoparse
+
+
+class StateFile(object):
+    """
+    records the end of the last completed export window per export in a json
+    file, so that an interrupted or incremental export resumes from there.
+    The file is replaced atomically after each update.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = path.expanduser(filename)
+        self.state = {}
+        if path.exists(self.filename):
+            with open(self.filename, "r") as file:
+                self.state = json.load(file)
+
+    def get(self, key: str) -> Optional[datetime]:
+        value = self.state.get(key)
+        return isoparse(value) if value else None
+
+    def update(self, key: str, end_time: datetime):
+        self.state[key] = end_time.isoformat()
+        tmp = f"{self.filename}.tmp"
+        with open(tmp, "w") as file:
+            json.dump(self.state, file, indent=2, sort_keys=True)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, self.filename)
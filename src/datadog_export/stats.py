@@ -0,0 +1,181 @@
+import cProfile
+import json
+import os
+import threading
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter, thread_time
+from typing import Iterable, Iterator, Optional, TypeVar
+
+from datadog_export.logger import log
+
+T = TypeVar("T")
+
+
+class Stats(object):
+    """
+    counts the requests, bytes, windows, series, points, events and retries
+    of an export, and measures the wall clock and cpu time spent in each stage:
+
+        throttle  waiting for the rate limit
+        wait      connecting and waiting for the response headers
+        download  reading the response body
+        parse     decoding the responses into documents
+        convert   converting the timestamps to iso format
+        write     serializing the documents to the output
+
+    The time of a stage excludes the time of the stages nested within it,
+    like refetching a split window while parsing. Stages running on
+    concurrent workers are added up, so they may exceed the elapsed time.
+    """
+
+    stages = ["throttle", "wait", "download", "parse", "convert", "write"]
+    counters = [
+        "requests",
+        "bytes",
+        "cache_hits",
+        "retries",
+        "windows",
+        "series",
+        "points",
+        "events",
+    ]
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self.counts = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.cpu = defaultdict(float)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counts[name] += value
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        measures the time spent in the stage `name`, on the current thread.
+        """
+        stack = self.local.__dict__.setdefault("stack", [])
+        frame = [perf_counter(), thread_time(), 0.0, 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            wall = perf_counter() - frame[0]
+            cpu = thread_time() - frame[1]
+            if stack:
+                stack[-1][2] += wall
+                stack[-1][3] += cpu
+            with self.lock:
+                self.seconds[name] += wall - frame[2]
+                self.cpu[name] += cpu - frame[3]
+
+    def move(self, source: str, target: str, seconds: float):
+        """
+        attributes `seconds` of wall clock time measured in stage `source` to
+        stage `target`.
+        """
+        with self.lock:
+            self.seconds[source] -= seconds
+            self.seconds[target] += seconds
+
+    def timed(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        """
+        yields the items of the `iterable`, measuring the time spent producing
+        them in the stage `name`.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    @contextmanager
+    def measured(self, profile: Optional[str] = None, trace_memory: bool = False):
+        """
+        measures the elapsed time of the export. Optionally, the calling thread
+        is profiled with cProfile into the file `profile`, and the peak memory
+        allocated by Python is traced with tracemalloc.
+        """
+        profiler = cProfile.Profile() if profile else None
+        if trace_memory:
+            tracemalloc.start()
+        if profiler:
+            profiler.enable()
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.elapsed += perf_counter() - started
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(profile)
+                log.info(f"profile written to {profile}")
+            if trace_memory:
+                snapshot = tracemalloc.take_snapshot()
+                self.counts["memory_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                for statistic in snapshot.statistics("lineno")[:10]:
+                    log.info(f"allocated {statistic}")
+
+    def to_dict(self) -> dict:
+        counters = {name: self.counts[name] for name in self.counters}
+        counters.update(self.counts)
+        return {
+            "elapsed": self.elapsed,
+            "counters": counters,
+            "stages": {
+                name: {"seconds": self.seconds[name], "cpu": self.cpu[name]}
+                for name in self.stages
+            },
+        }
+
+    def to_prometheus(self, labels: dict) -> str:
+        """
+        returns the statistics in the Prometheus text exposition format.
+        """
+        label = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+        lines = [
+            "# TYPE datadog_export_elapsed_seconds gauge",
+            f"datadog_export_elapsed_seconds{{{label}}} {self.elapsed}",
+        ]
+        for name, value in self.to_dict()["counters"].items():
+            kind = "gauge" if name == "memory_peak_bytes" else "counter"
+            metric = f"datadog_export_{name}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric}{{{label}}} {value}")
+        for measure, values in [("seconds", self.seconds), ("cpu_seconds", self.cpu)]:
+            metric = f"datadog_export_stage_{measure}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for name in self.stages:
+                lines.append(f'{metric}{{{label},stage="{name}"}} {values[name]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename: str, labels: dict):
+        """
+        writes the statistics to `filename` atomically, in the Prometheus
+        textfile format if it ends with .prom, otherwise in json.
+        """
+        if filename.endswith(".prom"):
+            content = self.to_prometheus(labels)
+        else:
+            content = json.dumps(dict(labels, **self.to_dict()), indent=2) + "\n"
+        temporary = f"{filename}.tmp"
+        with open(temporary, "w") as file:
+            file.write(content)
+        os.replace(temporary, filename)
+
+    def __str__(self) -> str:
+        counts = ", ".join(
+            f"{self.counts[name]} {name.replace('_', ' ')}" for name in self.counters
+        )
+        stages = ", ".join(f"{name} {self.seconds[name]:.1f}s" for name in self.stages)
+        return f"{counts}. {stages}"
@@ -0,0 +1,58 @@
+import io
+from typing import Any, BinaryIO, Iterator, Tuple
+
+import requests
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+def require_ijson():
+    if ijson is None:
+        raise ImportError(
+            "streaming responses requires ijson, install datadog-exporter[streaming]"
+        )
+
+
+def body(response: requests.Response) -> BinaryIO:
+    """
+    returns the body of the `response` as a file, reading from the socket
+    or the cache file unless the content has already been read.
+    """
+    if response.raw is None or getattr(response, "_content_consumed", False):
+        return io.BytesIO(response.content)
+    if hasattr(response.raw, "decode_content"):
+        response.raw.decode_content = True
+    return response.raw
+
+
+def members(file: BinaryIO, array: str) -> Iterator[Tuple[str, Any]]:
+    """
+    parses the json object in `file` incrementally. Each element of the
+    member `array` is yielded as (`array`.item, element) as soon as it is
+    complete, the other members are yielded as (name, value).
+    """
+    require_ijson()
+    item = f"{array}.item"
+    key = None
+    builder = None
+    for prefix, event, value in ijson.parse(file, use_float=True):
+        if prefix == "":
+            if event == "map_key":
+                key = value
+            continue
+        if prefix == array and event in ("start_array", "end_array"):
+            continue
+
+        if builder is None:
+            builder = ijson.ObjectBuilder()
+        builder.event(event, value)
+        if prefix in (item, key) and event not in (
+            "start_map",
+            "start_array",
+            "map_key",
+        ):
+            yield (item if prefix == item else key), builder.value
+            builder = None
@@ -0,0 +1,34 @@
+import io
+from typing import Callable
+
+import pytest
+
+from datadog_export.exporter import Exporter
+from datadog_export.mock_api import MockAPI
+
+
+@pytest.fixture
+def mock_api() -> Callable[..., MockAPI]:
+    """
+    starts a mock Datadog API with the given options, stopped after the test.
+    """
+    apis = []
+
+    def start(**kwargs) -> MockAPI:
+        api = MockAPI(seed=0, **kwargs).start()
+        apis.append(api)
+        return api
+
+    yield start
+    for api in apis:
+        api.stop()
+
+
+def connect(exporter: Exporter, api: MockAPI) -> Exporter:
+    """
+    connects the `exporter` to the mock `api`, writing the output to memory.
+    """
+    exporter.api_host = api.url
+    exporter.headers = {}
+    exporter.output = io.StringIO()
+    return exporter
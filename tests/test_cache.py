@@ -0,0 +1,73 @@
+import io
+import os
+
+import requests
+
+from datadog_export.cache import ResponseCache
+
+
+def response(content: bytes, stream: bool) -> requests.Response:
+    result = requests.Response()
+    result.status_code = 200
+    if stream:
+        result.raw = io.BytesIO(content)
+    else:
+        result._content = content
+        result._content_consumed = True
+    return result
+
+
+def put(cache: ResponseCache, n: int, content: bytes, stream: bool = False):
+    return cache.put("DEFAULT", "url", {"n": n}, response(content, stream), stream)
+
+
+def test_evicted_to_low_water_mark(tmp_path):
+    cache = ResponseCache(str(tmp_path), 1000)
+    for n in range(11):
+        put(cache, n, b"x" * 100)
+
+    assert cache.size == 900
+    assert len(os.listdir(tmp_path)) == 9
+    assert cache.get("DEFAULT", "url", {"n": 0}) is None
+    assert cache.get("DEFAULT", "url", {"n": 10}).content == b"x" * 100
+
+
+def test_least_recently_used_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path), 1000)
+    for n in range(10):
+        put(cache, n, b"x" * 100)
+    cache.get("DEFAULT", "url", {"n": 0})
+    put(cache, 10, b"x" * 100)
+
+    assert cache.get("DEFAULT", "url", {"n": 0}) is not None
+    assert cache.get("DEFAULT", "url", {"n": 1}) is None
+
+
+def test_index_read_from_directory(tmp_path):
+    cache = ResponseCache(str(tmp_path), 1000)
+    for n in range(3):
+        put(cache, n, b"x" * 100)
+
+    cache = ResponseCache(str(tmp_path), 1000)
+    assert cache.size == 300
+    assert len(cache.entries) == 3
+
+
+def test_streamed_response_read_from_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path), 1000)
+    cached = put(cache, 0, b'{"series": []}', stream=True)
+
+    assert cached.raw.read() == b'{"series": []}'
+    cached = cache.get("DEFAULT", "url", {"n": 0}, stream=True)
+    assert cached.json() == {"series": []}
+
+
+def test_streamed_response_larger_than_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path), 100)
+    put(cache, 0, b"x" * 50)
+    cached = put(cache, 1, b"y" * 1000, stream=True)
+
+    assert cached.content == b"y" * 1000
+    assert cache.get("DEFAULT", "url", {"n": 0}) is None
+    put(cache, 2, b"z" * 50)
+    assert cache.get("DEFAULT", "url", {"n": 1}) is None
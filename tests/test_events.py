@@ -0,0 +1,110 @@
+import json
+from datetime import datetime, timedelta
+
+import pytz
+from durations import Duration
+
+from datadog_export.events import EventsExporter
+from tests.conftest import connect
+
+start_time = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+first = int(start_time.timestamp())
+
+
+def exporter(api, hours: int, window: str = "1h") -> EventsExporter:
+    result = EventsExporter(
+        "DEFAULT", start_time, start_time + timedelta(hours=hours), Duration(window)
+    )
+    result.format = "ndjson"
+    return connect(result, api)
+
+
+def events(exporter: EventsExporter) -> list:
+    return [json.loads(line) for line in exporter.output.getvalue().splitlines()]
+
+
+def test_dense_windows_are_split(mock_api):
+    api = mock_api(events_per_hour=60, max_events=10)
+    e = exporter(api, 3)
+    e.max_events = 10
+    e.export()
+
+    ids = [event["id"] for event in events(e)]
+    assert sorted(ids) == list(range(first, first + 3 * 3600, 60))
+    assert len(ids) == len(set(ids))
+    assert api.requests > 3 * 6
+
+
+def test_quiet_windows_grow(mock_api):
+    api = mock_api(events_per_hour=1)
+    e = exporter(api, 24)
+    e.max_window = Duration("8h")
+    e.export()
+
+    ids = [event["id"] for event in events(e)]
+    assert sorted(ids) == list(range(first, first + 24 * 3600, 3600))
+    assert api.requests < 24
+
+
+def test_fixed_windows(mock_api):
+    api = mock_api(events_per_hour=60, max_events=10)
+    e = exporter(api, 3)
+    e.adaptive = False
+    e.export()
+
+    assert api.requests == 3
+    assert len(events(e)) == 30
+
+
+def test_aggregated_events_written_once(mock_api):
+    api = mock_api(events_per_hour=6, aggregate_period=3 * 3600)
+    e = exporter(api, 6)
+    e.adaptive = False
+    e.export()
+
+    result = events(e)
+    period = first // (3 * 3600)
+    assert [event["id"] for event in result] == [10**9 + period, 10**9 + period + 1]
+    for event in result:
+        children = [c["id"] for c in event["children"]]
+        assert len(children) == 18
+        assert children == sorted(children, reverse=True)
+
+
+def test_aggregated_events_without_dedup(mock_api):
+    api = mock_api(events_per_hour=6, aggregate_period=3 * 3600)
+    e = exporter(api, 6)
+    e.adaptive = False
+    e.deduplicate = False
+    e.export()
+
+    result = events(e)
+    assert len(result) == 6
+    assert all(len(event["children"]) == 6 for event in result)
+
+
+def test_aggregated_event_reappearing_with_new_children(mock_api):
+    api = mock_api(events_per_hour=6, aggregate_period=3 * 3600)
+    e = exporter(api, 6)
+    e.adaptive = False
+    e.deduplicator.horizon = 6 * 3600
+
+    for window in [(0, 1), (3, 4), (1, 2)]:
+        st, et = (start_time + timedelta(hours=h) for h in window)
+        response = e.fetch(st, et).json()
+        e.process(response)
+    e.flush()
+
+    children = [[c["id"] for c in event["children"]] for event in events(e)]
+    assert sorted(len(c) for c in children) == [6, 6, 6]
+    assert len({id for c in children for id in c}) == 18
+
+
+def test_split_windows_end_at_end_time(mock_api):
+    api = mock_api(events_per_hour=600, max_events=100)
+    e = exporter(api, 2, "50m")
+    e.max_events = 100
+    e.export()
+
+    ids = [event["id"] for event in events(e)]
+    assert sorted(ids) == list(range(first, first + 2 * 3600, 6))
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from datadog_export import fanout
+
+
+@pytest.fixture
+def account(mock_api, tmp_path, monkeypatch):
+    """
+    configures the DEFAULT account to use a mock api with 3 metrics.
+    """
+    api = mock_api(series=1, metrics=3)
+    (tmp_path / ".datadog.ini").write_text(
+        f"[DEFAULT]\napi_key=a\napp_key=b\napi_host={api.url}\n"
+    )
+    monkeypatch.setenv("HOME", str(tmp_path))
+    return api
+
+
+def fan_out(tmp_path, *args: str):
+    return CliRunner().invoke(
+        fanout.main,
+        [
+            "--pattern",
+            "synthetic.*",
+            "--output-dir",
+            str(tmp_path / "output"),
+            "--start-time",
+            "2024-01-01T00:00:00Z",
+            "--end-time",
+            "2024-01-01T02:00:00Z",
+            "--window",
+            "1h",
+            *args,
+        ],
+    )
+
+
+def test_metric_per_file(account, tmp_path):
+    result = fan_out(tmp_path, "--format", "ndjson")
+
+    assert result.exit_code == 0, result.output
+    for n in range(3):
+        filename = tmp_path / "output" / f"synthetic.metric.{n}.ndjson"
+        records = [json.loads(line) for line in filename.read_text().splitlines()]
+        assert {r["metric"] for r in records} == {f"synthetic.metric.{n}"}
+    assert account.requests == 1 + 2
+
+
+def test_timeout_applied_to_the_queries(account, tmp_path, monkeypatch):
+    timeouts = []
+    monkeypatch.setattr(
+        fanout.FanOutExporter, "export", lambda self: timeouts.append(self.timeout)
+    )
+    result = fan_out(tmp_path, "--timeout", "5")
+
+    assert result.exit_code == 0, result.output
+    assert timeouts == [5.0]
+
+
+def test_columnar_formats_cannot_be_resumed(account, tmp_path):
+    state_file = str(tmp_path / "state.json")
+    result = fan_out(tmp_path, "--format", "parquet", "--state-file", state_file)
+
+    assert result.exit_code == 2
+    assert "cannot be resumed" in result.output
+
+
+def test_resumed_by_appending(account, tmp_path):
+    state_file = str(tmp_path / "state.json")
+    fan_out(tmp_path, "--format", "ndjson", "--state-file", state_file)
+    result = fan_out(
+        tmp_path,
+        "--format",
+        "ndjson",
+        "--state-file",
+        state_file,
+        "--end-time",
+        "2024-01-01T03:00:00Z",
+    )
+
+    assert result.exit_code == 0, result.output
+    filename = tmp_path / "output" / "synthetic.metric.0.ndjson"
+    timestamps = [json.loads(line)["timestamp"] for line in open(filename)]
+    assert timestamps[0] == 1704067200000.0
+    assert timestamps[-1] == 1704078000000.0
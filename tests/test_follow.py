@@ -0,0 +1,46 @@
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+from durations import Duration
+
+from datadog_export import exporter
+from datadog_export.metrics import MetricsExporter
+from tests.conftest import connect
+
+
+@pytest.fixture
+def interrupted(monkeypatch):
+    """
+    interrupts following when it waits for the next window.
+    """
+
+    def sleep(seconds: float):
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(exporter, "sleep", sleep)
+
+
+def test_follow_writes_each_point_once(mock_api, interrupted):
+    api = mock_api(series=2)
+    now = datetime.now().astimezone(pytz.UTC).replace(minute=0, second=0, microsecond=0)
+    start_time = now - timedelta(hours=3)
+    e = MetricsExporter("DEFAULT", start_time, now, Duration("1h"))
+    e = connect(e, api)
+    e.queries = ["avg:m{*} by {host}"]
+    e.format = "ndjson"
+    e.follow = True
+    e.export()
+
+    series = defaultdict(list)
+    for line in e.output.getvalue().splitlines():
+        record = json.loads(line)
+        series[record["scope"]].append(record["timestamp"])
+    first = int(start_time.timestamp())
+    expected = [t * 1000.0 for t in range(first, first + 3 * 3600 + 1, 20)]
+    assert api.requests == 3
+    assert sorted(series) == ["host:host-0", "host:host-1"]
+    for timestamps in series.values():
+        assert timestamps == expected
@@ -0,0 +1,131 @@
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+from durations import Duration
+
+from datadog_export.downsample import Downsampler
+from datadog_export.metrics import MetricsExporter
+from tests.conftest import connect
+
+start_time = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+end_time = start_time + timedelta(hours=3)
+queries = ["avg:m.a{*} by {host}", "avg:m.b{*} by {host}"]
+
+
+def exporter(api, window: str = "1h") -> MetricsExporter:
+    result = MetricsExporter("DEFAULT", start_time, end_time, Duration(window))
+    result.queries = list(queries)
+    result.format = "ndjson"
+    return connect(result, api)
+
+
+def records(exporter: MetricsExporter) -> list:
+    return [json.loads(line) for line in exporter.output.getvalue().splitlines()]
+
+
+def value(n: int, timestamp: float, interval: int = 20) -> float:
+    """
+    the value of series `n` at `timestamp` ms returned by the mock api.
+    """
+    return float(n + (timestamp // 1000 // interval) % 100)
+
+
+def test_queries_batched_per_window(mock_api):
+    api = mock_api(series=3)
+    e = exporter(api)
+    documents = list(e.iterate())
+
+    assert api.requests == 3
+    assert [d["query"] for d in documents] == queries * 3
+    for d in documents:
+        metric = d["query"].split(":")[1].split("{")[0]
+        assert [s["metric"] for s in d["series"]] == [metric] * 3
+
+
+def test_queries_split_over_batches(mock_api):
+    api = mock_api(series=3)
+    e = exporter(api)
+    e.max_query_length = len(queries[0])
+    documents = list(e.iterate())
+
+    assert api.requests == 6
+    assert [d["query"] for d in documents] == queries * 3
+    assert all(len(d["series"]) == 3 for d in documents)
+
+
+def test_windows_overlap_without_stitching(mock_api):
+    api = mock_api(series=1)
+    e = exporter(api, "45m")
+    e.queries = queries[:1]
+    e.export()
+
+    timestamps = [r["timestamp"] for r in records(e)]
+    assert len(timestamps) == len(set(timestamps)) + 3
+
+
+@pytest.mark.parametrize("window", ["45m", "1h"])
+def test_stitched_series_are_continuous(mock_api, window):
+    api = mock_api(series=2)
+    e = exporter(api, window)
+    e.stitch = True
+    e.export()
+
+    series = defaultdict(list)
+    for r in records(e):
+        series[(r["metric"], r["scope"])].append(r["timestamp"])
+    first = int(start_time.timestamp())
+    expected = [t * 1000.0 for t in range(first, first + 3 * 3600 + 1, 20)]
+    assert sorted(series) == [
+        (m, f"host:host-{n}") for m in ["m.a", "m.b"] for n in range(2)
+    ]
+    for timestamps in series.values():
+        assert timestamps == expected
+
+
+def buckets(n: int, interval: int) -> dict:
+    """
+    the points of series `n` returned by the mock api, per bucket.
+    """
+    first = int(start_time.timestamp())
+    result = defaultdict(list)
+    for t in range(first, first + 3 * 3600 + 1, 20):
+        result[t // interval * interval * 1000.0].append(value(n, t * 1000))
+    return result
+
+
+def test_downsampled_series(mock_api):
+    api = mock_api(series=2)
+    e = exporter(api, "45m")
+    e.downsampler = Downsampler(1800, ["avg", "max", "count"])
+    e.export()
+
+    result = defaultdict(dict)
+    for r in records(e):
+        result[(r["metric"], r["scope"], r["rollup"])][r["timestamp"]] = r["value"]
+    assert len(result) == 2 * 2 * 3
+    for n in range(2):
+        expected = buckets(n, 1800)
+        for metric in ["m.a", "m.b"]:
+            scope = f"host:host-{n}"
+            for timestamp, values in expected.items():
+                avg = result[(metric, scope, "avg")][timestamp]
+                assert avg == pytest.approx(sum(values) / len(values))
+                assert result[(metric, scope, "max")][timestamp] == max(values)
+                assert result[(metric, scope, "count")][timestamp] == len(values)
+
+
+def test_stitched_downsampled_series_keep_all_aggregations(mock_api):
+    api = mock_api(series=1)
+    e = exporter(api, "45m")
+    e.queries = queries[:1]
+    e.stitch = True
+    e.downsampler = Downsampler(1800, ["avg", "max"])
+    e.export()
+
+    rollups = defaultdict(int)
+    for r in records(e):
+        rollups[r["rollup"]] += 1
+    assert rollups == {"avg": 7, "max": 7}
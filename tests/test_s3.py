@@ -0,0 +1,187 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import boto3
+import pytest
+import pytz
+import requests
+from durations import Duration
+from moto import mock_aws
+
+from datadog_export.errors import APIError
+from datadog_export.metrics import MetricsExporter
+from datadog_export.output import Output
+from datadog_export.s3 import S3Writer
+
+part_size = 5 * 1024 * 1024
+
+
+@pytest.fixture
+def s3():
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket="bucket")
+        yield client
+
+
+def keys(s3) -> list:
+    return [o["Key"] for o in s3.list_objects_v2(Bucket="bucket").get("Contents", [])]
+
+
+def uploads(s3) -> list:
+    return s3.list_multipart_uploads(Bucket="bucket").get("Uploads", [])
+
+
+def test_single_part(s3):
+    writer = S3Writer(s3, "bucket", "export.json", part_size=part_size)
+    writer.write(b'{"series": []}')
+    writer.close()
+
+    assert writer.upload_id is None
+    body = s3.get_object(Bucket="bucket", Key="export.json")["Body"].read()
+    assert body == b'{"series": []}'
+
+
+def test_multipart(s3):
+    data = os.urandom(2 * part_size + 1024)
+    writer = S3Writer(s3, "bucket", "export.json", part_size=part_size)
+    for offset in range(0, len(data), 1024 * 1024):
+        writer.write(data[offset : offset + 1024 * 1024])
+    writer.close()
+
+    assert [p["PartNumber"] for p in writer.parts] == [1, 2, 3]
+    assert s3.get_object(Bucket="bucket", Key="export.json")["Body"].read() == data
+    assert uploads(s3) == []
+
+
+def test_abort_multipart(s3):
+    writer = S3Writer(s3, "bucket", "export.json", part_size=part_size)
+    writer.write(os.urandom(2 * part_size))
+    assert writer.upload_id
+    writer.abort()
+
+    assert writer.closed
+    assert keys(s3) == []
+    assert uploads(s3) == []
+    with pytest.raises(ValueError):
+        writer.write(b"more")
+
+
+def test_abort_single_part(s3):
+    writer = S3Writer(s3, "bucket", "export.json", part_size=part_size)
+    writer.write(b'{"series": []}')
+    writer.abort()
+
+    assert keys(s3) == []
+
+
+def test_output_completes_upload(s3):
+    output = Output("s3://bucket/{account}.ndjson", "gzip", variables={"account": "a"})
+    output.s3_client = s3
+    output.write(b'{"value": 1}\n')
+    output.close()
+
+    assert keys(s3) == ["a.ndjson.gz"]
+
+
+def test_output_aborted_on_failure(s3):
+    output = Output("s3://bucket/export.ndjson", "gzip")
+    output.s3_client = s3
+    output.write(os.urandom(part_size + 1024))
+    output.abort()
+    output.close()
+
+    assert keys(s3) == []
+    assert uploads(s3) == []
+
+
+class FailingPart(object):
+    """
+    an s3 client failing the upload of part `number`.
+    """
+
+    def __init__(self, client, number: int):
+        self.client = client
+        self.number = number
+
+    def upload_part(self, **kwargs):
+        if kwargs["PartNumber"] == self.number:
+            raise IOError(f"part {self.number} failed")
+        return self.client.upload_part(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def test_output_aborted_when_a_part_fails(s3):
+    output = Output("s3://bucket/export.ndjson", max_in_flight=1)
+    output.s3_client = FailingPart(s3, 2)
+    data = os.urandom(part_size)
+    for _ in range(4):
+        output.write(data)
+    with pytest.raises(IOError):
+        output.close()
+
+    assert keys(s3) == []
+    assert uploads(s3) == []
+
+
+def test_resume_to_s3_requires_start(s3):
+    with pytest.raises(ValueError):
+        Output("s3://bucket/export.ndjson", append=True)
+
+    output = Output("s3://bucket/{start}.ndjson", append=True)
+    output.close()
+
+
+class Session(object):
+    """
+    a Datadog API returning a series per window, failing from window `failing`.
+    """
+
+    def __init__(self, failing: int):
+        self.failing = failing
+        self.calls = 0
+
+    def get(self, url, params, **kwargs) -> requests.Response:
+        self.calls += 1
+        response = requests.Response()
+        response.request = requests.Request("GET", url, params=params).prepare()
+        response.status_code = 400 if self.calls >= self.failing else 200
+        response._content = json.dumps(
+            {
+                "status": "ok",
+                "series": [
+                    {
+                        "metric": "a",
+                        "scope": "*",
+                        "pointlist": [[int(params["from"]) * 1000.0, 1.0]],
+                    }
+                ],
+            }
+        ).encode("utf-8")
+        return response
+
+
+def test_failed_export_is_not_published(s3):
+    start_time = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+    exporter = MetricsExporter(
+        "DEFAULT", start_time, start_time + timedelta(hours=6), Duration("1h")
+    )
+    exporter.headers = {}
+    exporter.session = Session(failing=4)
+    exporter.queries = ["avg:a{*}"]
+    exporter.open_output("s3://bucket/export.json")
+    exporter.sink.s3_client = s3
+    with pytest.raises(APIError):
+        try:
+            exporter.export()
+        except Exception:
+            exporter.close(failed=True)
+            raise
+
+    assert keys(s3) == []
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import pytz
+from click.testing import CliRunner
+from durations import Duration
+
+from datadog_export import metrics
+from datadog_export.metrics import MetricsExporter
+from datadog_export.state import StateFile
+from tests.conftest import connect
+
+
+def test_resume_from_state_older_than_a_window(mock_api, tmp_path):
+    api = mock_api(series=1)
+    now = datetime.now().astimezone(pytz.UTC).replace(minute=0, second=0, microsecond=0)
+    e = connect(MetricsExporter("DEFAULT", None, now, Duration("1h")), api)
+    e.queries = ["avg:m{*}"]
+    e.state = StateFile(str(tmp_path / "state.json"))
+    e.state.update(e.state_key(), now - timedelta(hours=5))
+
+    documents = list(e.iterate())
+
+    assert len(documents) == 5
+    assert documents[0]["from_date"] == (now - timedelta(hours=5)).timestamp() * 1000
+    assert StateFile(e.state.filename).get(e.state_key()) == now
+
+
+def test_start_time_before_state(mock_api, tmp_path):
+    api = mock_api(series=1)
+    start_time = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+    e = MetricsExporter(
+        "DEFAULT", start_time, start_time + timedelta(hours=6), Duration("1h")
+    )
+    e = connect(e, api)
+    e.queries = ["avg:m{*}"]
+    e.state = StateFile(str(tmp_path / "state.json"))
+    e.state.update(e.state_key(), start_time + timedelta(hours=4))
+
+    assert len(list(e.iterate())) == 2
+
+
+def test_columnar_formats_cannot_be_resumed(tmp_path):
+    result = CliRunner().invoke(
+        metrics.main,
+        [
+            "--format",
+            "parquet",
+            "--state-file",
+            str(tmp_path / "state.json"),
+            "avg:m{*}",
+        ],
+    )
+
+    assert result.exit_code == 2
+    assert "cannot be resumed" in result.output